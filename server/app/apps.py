@@ -1,5 +1,20 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_migrate, pre_migrate
 
 
 class AppConfig(AppConfig):
     name = 'app'
+
+    def ready(self):
+        # Compile the permission policy right away to fail early on mistakes
+        from .permissions import get_policy
+        get_policy()
+
+        from .middleware import install_query_recorder
+        connection_created.connect(install_query_recorder)
+
+        from .search import drop_search_content_view, register_functions, restore_search_index
+        connection_created.connect(register_functions)
+        pre_migrate.connect(drop_search_content_view, sender=self)
+        post_migrate.connect(restore_search_index, sender=self)
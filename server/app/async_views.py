@@ -0,0 +1,47 @@
+from asgiref.sync import sync_to_async
+from . import views
+from .permissions import readable_namespaces
+
+# Async versions of the read views for running under ASGI, see
+# settings.CROSSCUTT_ASYNC_VIEWS. Articles in the cache are served within the
+# event loop, unless their responses have to be compressed first. That and
+# everything that needs the database runs in the thread that Django reserves
+# for synchronous code, since this version of Django has no async ORM.
+
+async def get_previews(request):
+    namespaces = readable_namespaces(await get_username(request))
+    return await sync_to_async(views.previews_response)(request, namespaces, prefetch=True)
+
+async def get_changes(request):
+    namespaces = readable_namespaces(await get_username(request))
+    return await sync_to_async(views.changes_response)(request, namespaces)
+
+async def get_search(request):
+    namespaces = readable_namespaces(await get_username(request))
+    return await sync_to_async(views.search_response)(request, namespaces)
+
+async def get_article(request):
+    locator, permissions, response = views.resolve_article_request(request, await get_username(request))
+    if response is not None:
+        return response
+
+    cached, response = views.cached_article_response_without_compressing(request, locator, permissions)
+    if response is None and cached is not None:
+        response = await sync_to_async(views.versioned_article_response)(request, cached, permissions)
+    if response is None:
+        response = await sync_to_async(views.load_article_response)(request, locator, permissions)
+    return response
+
+async def get_articles(request):
+    locators, permissions, response = views.resolve_articles_request(request, await get_username(request))
+    if response is not None:
+        return response
+
+    articles, missing = views.cached_articles(locators, permissions)
+    if missing:
+        articles.update(await sync_to_async(views.load_articles)(missing))
+    return views.articles_response(request, locators, permissions, articles)
+
+# The user is loaded lazily from the session, which may query the database
+async def get_username(request):
+    return await sync_to_async(views.get_username)(request.user)
@@ -0,0 +1,32 @@
+import re
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+PRAGMA_VALUE = re.compile(r"^\w+$")
+
+# The SQLite backend of Django with two changes for concurrent use:
+#
+# * The pragmas in OPTIONS["pragmas"] are applied to every new connection,
+#   e.g. to switch to WAL mode or to wait for locks via busy_timeout.
+# * Transactions start with BEGIN IMMEDIATE, which takes the write lock right
+#   away. A transaction that reads and then writes would otherwise fail with
+#   "database is locked" without waiting if another writer got there first.
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        self.pragmas = kwargs.pop("pragmas", {})
+
+        for pragma, value in self.pragmas.items():
+            if not PRAGMA_VALUE.match(pragma) or not PRAGMA_VALUE.match(str(value)):
+                raise ImproperlyConfigured("Invalid SQLite pragma " + str(pragma) + " = " + str(value))
+
+        return kwargs
+
+    def get_new_connection(self, conn_params):
+        connection = super().get_new_connection(conn_params)
+        for pragma, value in self.pragmas.items():
+            connection.execute("PRAGMA %s = %s" % (pragma, value))
+        return connection
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute("BEGIN IMMEDIATE")
@@ -0,0 +1,534 @@
+import asyncio
+import io
+import json
+import math
+import platform
+import random
+import sqlite3
+import sys
+import threading
+import time
+import tracemalloc
+from urllib.parse import urlencode
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import django
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection, connections
+from django.db.models import Max, Min
+from django.test import AsyncClient, Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path, reverse
+from . import async_views, views
+from .cache import article_cache
+from .corpus import WORDS, CorpusGenerator, generate_corpus
+from .domain.article import Article as DomainArticle, ArticleSerializationService
+from .domain.locator import Locator, LocatorSerializationService
+from .domain.preview import ArticlePreview
+from .models import Article
+from .search import is_search_available
+from .urls import get_urlpatterns
+
+USERNAME = "benchmark"
+
+HOT_ARTICLES = 10
+
+# Number of articles that the scaling suite looks up
+SAMPLED_LOCATORS = 500
+
+# Lengths of the texts of the articles that the wire format suite serves
+WIRE_FORMAT_TEXT_SIZES = { "1KB": 1024, "100KB": 100 * 1024, "5MB": 5 * 1024 * 1024 }
+
+# Drives the API through the test client against a corpus generated with the
+# given parameters, which must be written to an empty database. Returns the
+# throughput, the latency percentiles and the query counts of every scenario.
+def run_benchmarks(articles, namespaces, requests, seed=0, warmup=10):
+    generate_corpus(articles, namespaces, seed)
+
+    with benchmark_client(namespaces) as client:
+        benchmark = Benchmark(client, namespaces, seed)
+        return {
+            "parameters": { "articles": articles, "namespaces": namespaces, "requests": requests, "seed": seed },
+            "environment": get_environment(),
+            "scenarios": measure_scenarios(benchmark.get_scenarios(), requests, warmup),
+        }
+
+# Grows one corpus through the given sizes, starting from an empty database,
+# and measures the scenarios whose cost may depend on the number of articles
+# at every size, including the peak memory of a request
+def run_scaling_benchmarks(sizes, namespaces, requests, seed=0, warmup=10):
+    sizes = sorted(set(sizes))
+    results = {}
+    with benchmark_client(namespaces) as client:
+        count = 0
+        for size in sizes:
+            generate_corpus(size, namespaces, seed, first=count)
+            count = size
+            benchmark = ScalingBenchmark(client, seed)
+            results[str(size)] = measure_scenarios(benchmark.get_scenarios(), requests, warmup, trace_memory=True)
+
+    return {
+        "parameters": { "sizes": sizes, "namespaces": namespaces, "requests": requests, "seed": seed },
+        "environment": get_environment(),
+        "sizes": results,
+    }
+
+# Serves articles with texts of the given sizes in both wire formats, from
+# the cache and from the database, and decodes them the way clients do
+def run_wire_format_benchmarks(requests, seed=0, warmup=10, sizes=WIRE_FORMAT_TEXT_SIZES):
+    generator = CorpusGenerator(seed)
+    results = {}
+    with benchmark_client(["public"]) as client:
+        for name, length in sizes.items():
+            article = Article.objects.create(namespace="public", title="Article " + name, text=generator.make_text(length))
+            benchmark = WireFormatBenchmark(client, "public/" + article.title)
+            results[name] = {
+                "response_bytes": { wire_format: benchmark.get_response_size(wire_format) for wire_format in ["1", "2"] },
+                "scenarios": measure_scenarios(benchmark.get_scenarios(), requests, warmup),
+            }
+
+    return {
+        "parameters": { "sizes": sizes, "requests": requests, "seed": seed },
+        "environment": get_environment(),
+        "sizes": results,
+    }
+
+# Sends requests from many clients at once, through the synchronous views
+# with a thread per client, as under WSGI, and through the async views with a
+# task per client in one event loop, as under ASGI. Every request goes through
+# the whole middleware chain. Needs a database that other threads can access,
+# which excludes the transactions of TestCase.
+def run_concurrency_benchmarks(articles, namespaces, requests, concurrency, seed=0, warmup=10):
+    generate_corpus(articles, namespaces, seed)
+
+    results = {}
+    with benchmark_client(namespaces) as client:
+        for name, read_views in [("sync", views), ("async", async_views)]:
+            with override_settings(ROOT_URLCONF=UrlConf(read_views)):
+                benchmark = ConcurrencyBenchmark(seed)
+                if name == "sync":
+                    load = lambda scenario: run_thread_load(client, scenario, requests, concurrency, warmup)
+                else:
+                    load = lambda scenario: async_to_sync(run_async_load)(client, scenario, requests, concurrency, warmup)
+                results[name] = { scenario_name: load(scenario) for scenario_name, scenario in benchmark.get_scenarios().items() }
+
+    return {
+        "parameters": { "articles": articles, "namespaces": namespaces, "requests": requests, "concurrency": concurrency, "seed": seed },
+        "environment": get_environment(),
+        "views": results,
+    }
+
+class UrlConf:
+    def __init__(self, read_views):
+        self.urlpatterns = [path("api/", include(get_urlpatterns(read_views)))]
+
+# Scenarios return the URLs to request, which are sent by clients of either
+# kind. The query strings are part of the URLs, since AsyncClient ignores the
+# data of GET requests in this version of Django.
+class ConcurrencyBenchmark:
+    def __init__(self, seed):
+        self.random = random.Random(seed)
+        self.locators = sample_locators(self.random, HOT_ARTICLES)
+
+    def get_scenarios(self):
+        return {
+            "get_article_cached": lambda: reverse("article") + "?" + urlencode({ "locator": self.random.choice(self.locators) }),
+            "get_previews_page": lambda: reverse("previews") + "?limit=100",
+        }
+
+def run_thread_load(client, scenario, requests, concurrency, warmup):
+    remaining = iter(range(warmup + requests))
+    lock = threading.Lock()
+    latencies = []
+
+    def work():
+        thread_client = Client()
+        thread_client.cookies.update(client.cookies)
+        try:
+            while True:
+                with lock:
+                    number = next(remaining, None)
+                    url = scenario()
+                if number is None:
+                    return
+                started_at = time.perf_counter()
+                response = thread_client.get(url)
+                latency = time.perf_counter() - started_at
+                check_response(response)
+                if number >= warmup:
+                    latencies.append(latency)
+        finally:
+            connections.close_all()
+
+    started_at = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        for future in [pool.submit(work) for _ in range(concurrency)]:
+            future.result()
+    return summarize_load(latencies, time.perf_counter() - started_at)
+
+async def run_async_load(client, scenario, requests, concurrency, warmup):
+    remaining = iter(range(warmup + requests))
+    latencies = []
+    async_client = AsyncClient()
+    async_client.cookies.update(client.cookies)
+
+    async def work():
+        for number in remaining:
+            url = scenario()
+            started_at = time.perf_counter()
+            response = await async_client.get(url)
+            latency = time.perf_counter() - started_at
+            check_response(response)
+            if number >= warmup:
+                latencies.append(latency)
+
+    started_at = time.perf_counter()
+    await asyncio.gather(*[work() for _ in range(concurrency)])
+    return summarize_load(latencies, time.perf_counter() - started_at)
+
+# The warmup requests run concurrently with the measured ones, so they count
+# towards the duration
+def summarize_load(latencies, duration):
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "throughput_per_second": len(latencies) / duration if duration > 0 else None,
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+# Builds the domain objects that requests create for every article and
+# preview, and measures how many are built per second and how much memory an
+# instance takes. The objects that kept their fields in a __dict__, which the
+# domain objects did before they got slots, are measured for comparison.
+def run_object_benchmarks(count):
+    data = { "namespace": "public", "id": "n1", "title": "Lemma 1", "text": "Every ideal is contained in a maximal ideal." }
+    row = ("public", "n1", "Lemma 1", "Every ideal is contained in a maximal ideal.")
+    return {
+        "parameters": { "objects": count },
+        "environment": get_environment(),
+        "objects": {
+            "locator": measure_objects(lambda: Locator("public", "Lemma 1"), count),
+            "locator_with_dict": measure_objects(lambda: DictLocator("public", "Lemma 1"), count),
+            "article": measure_objects(lambda: DomainArticle.fromCleanData(data, "full"), count),
+            "article_with_dict": measure_objects(lambda: DictArticle(data, "full"), count),
+            "preview": measure_objects(lambda: ArticlePreview._make(row), count),
+            "preview_dict": measure_objects(lambda: { "namespace": row[0], "id": row[1], "title": row[2], "preview": row[3] }, count),
+        },
+    }
+
+class DictLocator:
+    def __init__(self, namespace, name):
+        self.namespace = namespace
+        self.name = name
+
+class DictArticle:
+    def __init__(self, data, permissions):
+        self.data = ArticleSerializationService.cleanData(data)
+        self.permissions = permissions
+
+# The fields are shared by all instances, so only the instances themselves and
+# what they allocate are traced
+def measure_objects(make, count):
+    started_at = time.perf_counter()
+    for _ in range(count):
+        make()
+    duration = time.perf_counter() - started_at
+
+    tracemalloc.start()
+    try:
+        objects = [make() for _ in range(count)]
+        size = tracemalloc.get_traced_memory()[0] - sys.getsizeof(objects)
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "objects_per_second": count / duration if duration > 0 else None,
+        "bytes_per_instance": size / count,
+    }
+
+# Stores the texts of one corpus as they are and compressed from the given
+# threshold on, converting them with the compress-texts command, and measures
+# the size of the database, the share of it that the page cache of SQLite
+# holds and the latency of reading articles from the database
+def run_compression_benchmarks(articles, namespaces, requests, threshold, seed=0, warmup=10):
+    generate_corpus(articles, namespaces, seed)
+
+    results = {}
+    with benchmark_client(namespaces) as client:
+        for name, setting in [("uncompressed", None), ("compressed", threshold)]:
+            with override_settings(ARTICLE_TEXT_COMPRESSION_THRESHOLD=setting):
+                call_command("compress-texts", stdout=io.StringIO())
+                benchmark = CompressionBenchmark(client, seed)
+                results[name] = dict(measure_database(), scenarios=measure_scenarios(benchmark.get_scenarios(), requests, warmup))
+
+    return {
+        "parameters": { "articles": articles, "namespaces": namespaces, "requests": requests, "threshold": threshold, "seed": seed },
+        "environment": get_environment(),
+        "storage": results,
+    }
+
+# The size of the database after VACUUM, which cannot run inside a
+# transaction, and the share of it that fits into the page cache. For reads
+# spread evenly over the articles, that share is the page cache hit rate.
+def measure_database():
+    if connection.vendor != "sqlite":
+        return {}
+
+    with connection.cursor() as cursor:
+        cursor.execute("VACUUM")
+        database_bytes = pragma(cursor, "page_count") * pragma(cursor, "page_size")
+        # Negative sizes are in KiB, positive ones in pages
+        cache_size = pragma(cursor, "cache_size")
+        cache_bytes = -cache_size * 1024 if cache_size < 0 else cache_size * pragma(cursor, "page_size")
+        cursor.execute("SELECT SUM(LENGTH(CAST(text AS BLOB)) + IFNULL(LENGTH(compressed_text), 0)) FROM app_article")
+        text_bytes = cursor.fetchone()[0] or 0
+
+    return {
+        "database_bytes": database_bytes,
+        "text_bytes": text_bytes,
+        "page_cache_bytes": cache_bytes,
+        "page_cache_hit_rate": min(cache_bytes / database_bytes, 1.0),
+    }
+
+def pragma(cursor, name):
+    cursor.execute("PRAGMA " + name)
+    return cursor.fetchone()[0]
+
+@contextmanager
+def benchmark_client(namespaces):
+    permissions = { namespace: { USERNAME: "full" } for namespace in namespaces }
+    with override_settings(CROSSCUTT_PERMISSIONS=permissions):
+        client = Client()
+        client.force_login(User.objects.get_or_create(username=USERNAME)[0])
+        yield client
+
+def get_environment():
+    return {
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "database": connection.vendor,
+    }
+
+class Benchmark:
+    def __init__(self, client, namespaces, seed):
+        self.client = client
+        self.namespaces = namespaces
+        self.random = random.Random(seed)
+        self.generator = CorpusGenerator(seed + 1)
+        self.locators = [
+            namespace + "/" + title
+            for namespace, title in Article.objects.order_by("pk").values_list("namespace", "title")
+        ]
+        self.created = 0
+
+    def get_scenarios(self):
+        return {
+            "get_previews": self.get_previews,
+            "get_previews_page": self.get_previews_page,
+            "get_article_cached": self.get_article_cached,
+            "get_article_uncached": self.get_article_uncached,
+            "create_article": self.create_article,
+            "change_article": self.change_article,
+        }
+
+    def get_previews(self):
+        return self.client.get(reverse("previews"))
+
+    def get_previews_page(self):
+        return self.client.get(reverse("previews"), { "limit": 100 })
+
+    # A few popular articles, which stay in the cache
+    def get_article_cached(self):
+        return self.client.get(reverse("article"), { "locator": self.random.choice(self.locators[:HOT_ARTICLES]) })
+
+    def get_article_uncached(self):
+        article_cache.clear()
+        return self.client.get(reverse("article"), { "locator": self.random.choice(self.locators) })
+
+    def create_article(self):
+        self.created += 1
+        article = self.generator.make_article(len(self.locators) + self.created, self.random.choice(self.namespaces))
+        data = json.dumps({ "namespace": article.namespace, "id": article.article_id, "title": article.title, "text": article.text })
+        return self.client.post(reverse("create-article"), { "data": data })
+
+    def change_article(self):
+        namespace, title = self.random.choice(self.locators).split("/", 1)
+        text = self.generator.make_text(self.generator.make_text_length())
+        new_data = json.dumps({ "namespace": namespace, "id": None, "title": title, "text": text })
+        return self.client.post(reverse("change-article"), { "locator": namespace + "/" + title, "new_data": new_data })
+
+# Previews of the whole corpus, in one response and streamed, and a page of
+# them, the lookup of articles by locator, whose cost should not depend on the
+# size of the corpus, and full-text searches
+class ScalingBenchmark:
+    def __init__(self, client, seed):
+        self.client = client
+        self.random = random.Random(seed)
+        self.locators = sample_locators(self.random, SAMPLED_LOCATORS)
+
+    def get_scenarios(self):
+        scenarios = {
+            "get_previews": self.get_previews,
+            "get_previews_stream": self.get_previews_stream,
+            "get_previews_page": self.get_previews_page,
+            "resolve_locator": self.resolve_locator,
+            "get_article_uncached": self.get_article_uncached,
+        }
+        if is_search_available():
+            scenarios["search_one_word"] = lambda: self.search(1)
+            scenarios["search_two_words"] = lambda: self.search(2)
+        return scenarios
+
+    def get_previews(self):
+        return self.client.get(reverse("previews"))
+
+    def get_previews_stream(self):
+        return drain(self.client.get(reverse("previews"), { "stream": "" }))
+
+    def get_previews_page(self):
+        return self.client.get(reverse("previews"), { "limit": 100 })
+
+    # Only the query that finds the article, through the name index
+    def resolve_locator(self):
+        locator = LocatorSerializationService.deserialize(self.random.choice(self.locators))
+        Article.objects.filter(views.filter_by_locator(locator)).values_list("pk", flat=True).first()
+
+    def get_article_uncached(self):
+        article_cache.clear()
+        return self.client.get(reverse("article"), { "locator": self.random.choice(self.locators) })
+
+    def search(self, words):
+        return self.client.get(reverse("search"), { "query": " ".join(self.random.sample(WORDS, words)) })
+
+# Reads of random articles from the database, through the API and of the text
+# alone, which is where compressed texts are decompressed
+class CompressionBenchmark:
+    def __init__(self, client, seed):
+        self.client = client
+        self.random = random.Random(seed)
+        self.locators = sample_locators(self.random, SAMPLED_LOCATORS)
+        self.pks = Article.objects.aggregate(Min("pk"), Max("pk"))
+
+    def get_scenarios(self):
+        return {
+            "get_article_uncached": self.get_article_uncached,
+            "read_text": self.read_text,
+        }
+
+    def get_article_uncached(self):
+        article_cache.clear()
+        return self.client.get(reverse("article"), { "locator": self.random.choice(self.locators) })
+
+    def read_text(self):
+        pk = self.random.randint(self.pks["pk__min"], self.pks["pk__max"])
+        article = Article.objects.filter(pk__gte=pk).order_by("pk").first()
+        len(article.text)
+
+class WireFormatBenchmark:
+    def __init__(self, client, locator):
+        self.client = client
+        self.locator = locator
+
+    def get_scenarios(self):
+        return {
+            "format_1_cached": lambda: self.get_article("1", cached=True),
+            "format_1_uncached": lambda: self.get_article("1", cached=False),
+            "format_2_cached": lambda: self.get_article("2", cached=True),
+            "format_2_uncached": lambda: self.get_article("2", cached=False),
+        }
+
+    def get_article(self, wire_format, cached):
+        if not cached:
+            article_cache.clear()
+        response = self.client.get(reverse("article"), { "locator": self.locator, "format": wire_format })
+        decode_article(response.content, wire_format)
+        return response
+
+    def get_response_size(self, wire_format):
+        return len(self.client.get(reverse("article"), { "locator": self.locator, "format": wire_format }).content)
+
+# Format 1 nests the article and its data as JSON strings, which clients
+# decode one after the other
+def decode_article(content, wire_format):
+    article = json.loads(content)["article"]
+    if wire_format == "2":
+        return article
+    article = json.loads(article)
+    return dict(article, data=json.loads(article["data"]))
+
+# Locators of random articles, without loading all of them
+def sample_locators(random, count):
+    bounds = Article.objects.aggregate(Min("pk"), Max("pk"))
+    pk_range = range(bounds["pk__min"] or 1, (bounds["pk__max"] or 0) + 1)
+    pks = random.sample(pk_range, min(count, len(pk_range)))
+    return [
+        namespace + "/" + title
+        for namespace, title in Article.objects.filter(pk__in=pks).order_by("pk").values_list("namespace", "title")
+    ]
+
+def measure_scenarios(scenarios, requests, warmup, trace_memory=False):
+    return { name: measure_scenario(scenario, requests, warmup, trace_memory) for name, scenario in scenarios.items() }
+
+def measure_scenario(scenario, requests, warmup, trace_memory=False):
+    for _ in range(warmup):
+        check_response(scenario())
+
+    latencies = []
+    queries = []
+    started_at = time.perf_counter()
+    for _ in range(requests):
+        with CaptureQueriesContext(connection) as captured:
+            request_started_at = time.perf_counter()
+            response = scenario()
+            latencies.append(time.perf_counter() - request_started_at)
+        check_response(response)
+        queries.append(len(captured))
+    duration = time.perf_counter() - started_at
+
+    latencies.sort()
+    result = {
+        "requests": requests,
+        "throughput_per_second": requests / duration if duration > 0 else None,
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "mean_queries": sum(queries) / requests,
+        "max_queries": max(queries),
+    }
+    # Tracing slows everything down, so memory is measured in a separate run
+    if trace_memory:
+        result["peak_memory_bytes"] = measure_peak_memory(scenario)
+    return result
+
+def measure_peak_memory(scenario):
+    tracemalloc.start()
+    try:
+        check_response(scenario())
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+# Scenarios that do not send a request return None
+def check_response(response):
+    if response is None:
+        return
+    if response.status_code != 200:
+        raise BenchmarkException("Unexpected status %d" % response.status_code)
+    if not response.streaming and response.get("Content-Type") == "application/json" and response.json().get("success") is False:
+        raise BenchmarkException("Unexpected response: " + response.content.decode()[:200])
+
+# Reads a streamed response to the end without keeping it in memory
+def drain(response):
+    for _ in response.streaming_content:
+        pass
+    return response
+
+class BenchmarkException(Exception):
+    pass
+
+# Nearest-rank percentile of sorted values
+def percentile(values, fraction):
+    return values[max(math.ceil(fraction * len(values)) - 1, 0)]
@@ -0,0 +1,101 @@
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+
+# Entries older than max_age seconds are misses, unless max_age is None
+class LruCache:
+    def __init__(self, max_entries, max_bytes, max_age=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Incremented by every invalidation, see set
+        self.generation = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and self.max_age is not None and time.monotonic() - entry[2] >= self.max_age:
+                self.remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry[0]
+
+    # Sizes default to the length of the value in characters, which is exact
+    # for the mostly ASCII payloads we store and avoids encoding every value
+    # just to weigh it.
+    #
+    # A value read from the database before a concurrent write was committed
+    # would be stored after the write invalidated its key. To prevent that,
+    # readers take the generation before reading and pass it here, and the
+    # value is only stored if nothing has been invalidated in the meantime.
+    def set(self, key, value, size=None, generation=None):
+        if size is None:
+            size = len(value)
+        if size > self.max_bytes:
+            return
+
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                return
+            self.remove(key)
+            self.entries[key] = (value, size, time.monotonic())
+            self.bytes += size
+
+            while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+                _, (_, evicted_size, _) = self.entries.popitem(last=False)
+                self.bytes -= evicted_size
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self.lock:
+            self.remove(key)
+            self.generation += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+            self.generation += 1
+
+    def get_generation(self):
+        with self.lock:
+            return self.generation
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self.entries),
+                "bytes": self.bytes,
+            }
+
+    def remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[1]
+
+# views.CachedArticle tuples of articles by (namespace, name),
+# where name is either the ID or the title of the article. Writes only
+# invalidate the cache of the process that makes them, so the writes of other
+# server processes and of commands like tiddlywiki-import are only seen once
+# the entries are older than ARTICLE_CACHE_MAX_AGE_SECONDS.
+article_cache = LruCache(settings.ARTICLE_CACHE_MAX_ENTRIES, settings.ARTICLE_CACHE_MAX_BYTES, settings.ARTICLE_CACHE_MAX_AGE_SECONDS)
+
+# Compressed response bodies by (key of the content, encoding), see
+# app.compression. The keys contain the version of what was serialized, so
+# that entries of old versions are never served and simply age out.
+compressed_response_cache = LruCache(settings.COMPRESSED_RESPONSE_CACHE_MAX_ENTRIES, settings.COMPRESSED_RESPONSE_CACHE_MAX_BYTES)
@@ -0,0 +1,68 @@
+import gzip
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from .cache import compressed_response_cache
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Supported encodings, preferred first
+ENCODINGS = ["br", "gzip"] if brotli is not None else ["gzip"]
+
+# Responses are compressed while the client waits, e.g. the previews after
+# every write, where the highest levels take several times as long for a few
+# percent less
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+# Responses whose content is identified by a key, e.g. the primary key and the
+# version of an article, are compressed once per encoding and then served from
+# compressed_response_cache. The content is only built if it is not cached in
+# the encoding the client accepts. With only_cached, None is returned instead
+# of compressing, which callers in the event loop then do in a thread.
+def compressed_response(request, key, build_content, content_type="application/json", only_cached=False):
+    encoding = negotiate_encoding(request)
+
+    content = compressed_response_cache.get((key, encoding)) if encoding is not None else None
+    if content is None:
+        content = build_content().encode()
+        if encoding is not None and len(content) >= settings.COMPRESSED_RESPONSE_MIN_BYTES:
+            if only_cached:
+                return None
+            content = compress(content, encoding)
+            compressed_response_cache.set((key, encoding), content, size=len(content))
+        else:
+            encoding = None
+
+    response = HttpResponse(content, content_type=content_type)
+    if encoding is not None:
+        response["Content-Encoding"] = encoding
+    response["Content-Length"] = str(len(content))
+    patch_vary_headers(response, ["Accept-Encoding"])
+    return response
+
+# The supported encoding with the highest quality value in Accept-Encoding,
+# or None if the client accepts none of them
+def negotiate_encoding(request):
+    qualities = {}
+    for coding in request.headers.get("Accept-Encoding", "").split(","):
+        name, _, parameters = coding.partition(";")
+        quality = 1.0
+        parameter, _, value = parameters.partition("=")
+        if parameter.strip() == "q":
+            try:
+                quality = float(value)
+            except ValueError:
+                quality = 0.0
+        qualities[name.strip().lower()] = quality
+
+    best = max(ENCODINGS, key=lambda encoding: qualities.get(encoding, qualities.get("*", 0.0)))
+    return best if qualities.get(best, qualities.get("*", 0.0)) > 0 else None
+
+def compress(content, encoding):
+    if encoding == "br":
+        return brotli.compress(content, quality=BROTLI_QUALITY)
+    return gzip.compress(content, compresslevel=GZIP_LEVEL)
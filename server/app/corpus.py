@@ -0,0 +1,74 @@
+import math
+import random
+from datetime import datetime, timedelta, timezone
+from django.db import transaction
+from .models import Article, bulk_create_articles
+
+WORDS = (
+    "algebra group ring field module vector space basis dimension linear map kernel image quotient "
+    "homomorphism isomorphism subgroup normal coset order prime ideal polynomial root extension "
+    "topology open closed compact connected continuous limit sequence series convergence metric "
+    "measure integral derivative function set element relation graph vertex edge path cycle tree "
+    "proof lemma theorem definition example remark every some there exists for all if then and or "
+    "the a of is in to with on by as which that this we let be are has have not"
+).split()
+
+# Median length of the texts in characters. Lengths are log-normally
+# distributed like those of real notes: most are short, a few are very long.
+MEDIAN_TEXT_LENGTH = 1200
+TEXT_LENGTH_SIGMA = 1.2
+MAX_TEXT_LENGTH = 100000
+
+CREATED_AT = datetime(2020, 1, 1, tzinfo=timezone.utc)
+
+# Writes the synthetic articles numbered first to count - 1, spread evenly
+# over the namespaces. The same seed always produces the same articles, and a
+# corpus can be grown by generating the following numbers with another seed.
+def generate_corpus(count, namespaces, seed=0, batch_size=500, first=0):
+    generator = CorpusGenerator(seed)
+    for start in range(first, count, batch_size):
+        with transaction.atomic():
+            bulk_create_articles([
+                generator.make_article(i, namespaces[i % len(namespaces)])
+                for i in range(start, min(start + batch_size, count))
+            ])
+
+class CorpusGenerator:
+    def __init__(self, seed):
+        self.random = random.Random(seed)
+        self.titles = []
+
+    def make_article(self, number, namespace):
+        title = "%s %s %d" % (self.random.choice(WORDS).capitalize(), self.random.choice(WORDS), number)
+        created_at = CREATED_AT + timedelta(minutes=number)
+        article = Article(
+            article_id="n%d" % number if self.random.random() < 0.5 else None,
+            title=title,
+            text=self.make_text(self.make_text_length()),
+            namespace=namespace,
+            created_at=created_at,
+            last_modified_at=created_at + timedelta(days=self.random.randrange(365)))
+        self.titles.append(title)
+        return article
+
+    def make_text_length(self):
+        return min(int(self.random.lognormvariate(math.log(MEDIAN_TEXT_LENGTH), TEXT_LENGTH_SIGMA)), MAX_TEXT_LENGTH)
+
+    # Paragraphs of words with the occasional link to an earlier article and
+    # some inline math, which are the markup that previews have to strip
+    def make_text(self, length):
+        parts = []
+        size = 0
+        while size < length:
+            roll = self.random.random()
+            if roll < 0.02 and self.titles:
+                part = "[[" + self.random.choice(self.titles) + "]]"
+            elif roll < 0.04:
+                part = "$x_%d^2$" % self.random.randrange(10)
+            elif roll < 0.06:
+                part = "\n\n"
+            else:
+                part = self.random.choice(WORDS)
+            parts.append(part)
+            size += len(part) + 1
+        return " ".join(parts)[:length]
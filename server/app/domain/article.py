@@ -2,10 +2,20 @@ from .locator import Locator
 import json
 
 class Article:
+    __slots__ = ("data", "permissions")
+
     def __init__(self, data, permissions):
         self.data = ArticleSerializationService.cleanData(data)
         self.permissions = permissions
 
+    # Skips copying data that has already been cleaned
+    @classmethod
+    def fromCleanData(cls, data, permissions):
+        article = cls.__new__(cls)
+        article.data = data
+        article.permissions = permissions
+        return article
+
     def getData(self):
         self.ensureIsReadable()
         return self.data
@@ -35,15 +45,25 @@ class ArticleSerializationService:
     @staticmethod
     def serialize(article):
         data = article.getData()
+        return ArticleSerializationService.serializeWithSerializedData(json.dumps(data), article.permissions)
+
+    @staticmethod
+    def serializeWithSerializedData(serializedData, permissions):
         return json.dumps({
-            "data": ArticleSerializationService.serializeData(data),
-            "permissions": article.permissions,
+            "data": serializedData,
+            "permissions": permissions,
         })
 
+    # Version 2 of the wire format nests the data as an object instead of a
+    # string. It takes the serialized data to avoid encoding large texts twice.
+    @staticmethod
+    def serializeNestedWithSerializedData(serializedData, permissions):
+        return '{"data": ' + serializedData + ', "permissions": ' + json.dumps(permissions) + "}"
+
     @staticmethod
     def deserialize(string):
         parsed = json.loads(string)
-        return Article(ArticleSerializationService.deserializeData(parsed["data"]), parsed["permissions"])
+        return Article.fromCleanData(ArticleSerializationService.deserializeData(parsed["data"]), parsed["permissions"])
 
     @staticmethod
     def serializeData(data):
@@ -0,0 +1,55 @@
+import json
+import zlib
+from difflib import SequenceMatcher
+
+# A delta turns one text into another line by line. It is a list of
+# operations: a positive number copies that many lines of the old text, a
+# negative number skips that many lines of it and a string is inserted.
+def make_delta(old, new):
+    old_lines = old.splitlines(keepends=True)
+    new_lines = new.splitlines(keepends=True)
+
+    delta = []
+    matcher = SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            delta.append(i2 - i1)
+            continue
+        if i2 > i1:
+            delta.append(i1 - i2)
+        if j2 > j1:
+            delta.append("".join(new_lines[j1:j2]))
+
+    return delta
+
+def apply_delta(old, delta):
+    old_lines = old.splitlines(keepends=True)
+    position = 0
+    parts = []
+    for operation in delta:
+        if isinstance(operation, str):
+            parts.append(operation)
+        elif operation > 0:
+            parts.extend(old_lines[position:position + operation])
+            position += operation
+        else:
+            position -= operation
+
+    if position != len(old_lines):
+        raise DeltaException()
+    return "".join(parts)
+
+class DeltaException(Exception):
+    pass
+
+def compress_text(text):
+    return zlib.compress(text.encode())
+
+def decompress_text(data):
+    return zlib.decompress(data).decode()
+
+def compress_delta(delta):
+    return compress_text(json.dumps(delta, separators=(",", ":")))
+
+def decompress_delta(data):
+    return json.loads(decompress_text(data))
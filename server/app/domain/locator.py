@@ -1,4 +1,6 @@
 class Locator:
+    __slots__ = ("namespace", "name")
+
     def __init__(self, namespace, name):
         self.namespace = namespace
         self.name = name
@@ -0,0 +1,54 @@
+import re
+from collections import namedtuple
+
+PREVIEW_LENGTH = 200
+
+LINK = re.compile(r"\[\[([^|\]]*)(?:\|[^\]]*)?\]\]")
+
+LINE_MARKUP = re.compile(r"^\s*(?:# |\^ |_ |\*+|\|)")
+
+# The beginning of the text of an article with markdown removed and cut at a
+# word boundary, computed once when the article is written
+def make_preview(text):
+    lines = []
+    length = 0
+    for line in text.split("\n"):
+        line = LINK.sub(r"\1", LINE_MARKUP.sub("", line)).replace("$", "").replace("|", " ")
+        lines.append(line)
+        length += len(line)
+        if length > PREVIEW_LENGTH:
+            break
+
+    preview = " ".join(" ".join(lines).split())
+    if len(preview) <= PREVIEW_LENGTH:
+        return preview
+
+    cut = preview.rfind(" ", 0, PREVIEW_LENGTH + 1)
+    return preview[:cut if cut > 0 else PREVIEW_LENGTH]
+
+
+# Tuple-backed so that previews can be built straight from database rows
+class ArticlePreview(namedtuple("ArticlePreview", ["namespace", "id", "title", "description"])):
+    __slots__ = ()
+
+    def getNamespace(self):
+        return self.namespace
+
+    def getId(self):
+        return self.id
+
+    def getTitle(self):
+        return self.title
+
+    def getDescription(self):
+        return self.description
+
+class ArticlePreviewSerializationService:
+    @staticmethod
+    def serialize(preview):
+        return {
+            "namespace": preview.namespace,
+            "id": preview.id,
+            "title": preview.title,
+            "preview": preview.description,
+        }
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from app.benchmark import (
+    run_benchmarks, run_compression_benchmarks, run_concurrency_benchmarks, run_object_benchmarks, run_scaling_benchmarks,
+    run_wire_format_benchmarks)
+
+SUITES = ["api", "scaling", "objects", "wire-format", "concurrency", "compression"]
+
+class Command(BaseCommand):
+    help = "Benchmarks the API against a synthetic corpus in a test database and prints the results as JSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--suite", type=str, choices=SUITES, default="api",
+            help="The API scenarios, how previews, lookups and searches scale with the number of articles, the domain objects, "
+                "the wire formats of large articles, the sync and async views under concurrent load, or the storage of texts "
+                "with and without compression")
+        parser.add_argument("--articles", type=int, default=1000,
+            help="Number of articles in the corpus")
+        parser.add_argument("--sizes", type=str, default="10000,100000,1000000",
+            help="Comma-separated numbers of articles that the scaling suite measures at")
+        parser.add_argument("--objects", type=int, default=100000,
+            help="Number of instances that the objects suite builds of every type")
+        parser.add_argument("--concurrency", type=int, default=64,
+            help="Number of clients that the concurrency suite sends requests from at once")
+        parser.add_argument("--threshold", type=int, default=1024,
+            help="ARTICLE_TEXT_COMPRESSION_THRESHOLD that the compression suite compares with uncompressed texts")
+        parser.add_argument("--namespaces", type=str, default="public,paul",
+            help="Comma-separated namespaces to spread the articles over")
+        parser.add_argument("--requests", type=int, default=200,
+            help="Number of measured requests per scenario")
+        parser.add_argument("--warmup", type=int, default=10,
+            help="Number of requests per scenario before measuring")
+        parser.add_argument("--seed", type=int, default=0,
+            help="Seed of the corpus and of the requests")
+        parser.add_argument("--output", type=str,
+            help="File to write the results to instead of the standard output")
+
+    def handle(self, *args, **options):
+        namespaces = [namespace for namespace in options["namespaces"].split(",") if namespace]
+        if options["articles"] < 1 or options["requests"] < 1 or options["warmup"] < 0 or not namespaces:
+            raise CommandError("--articles and --requests must be positive and --namespaces must not be empty")
+        try:
+            sizes = [int(size) for size in options["sizes"].split(",")]
+        except ValueError:
+            raise CommandError("--sizes must be comma-separated numbers")
+        if min(sizes) < 1 or options["objects"] < 1 or options["concurrency"] < 1 or options["threshold"] < 1:
+            raise CommandError("--sizes, --objects, --concurrency and --threshold must be positive")
+
+        # Never touch the configured database, the benchmarks write to it
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            if options["suite"] == "compression":
+                results = run_compression_benchmarks(
+                    options["articles"], namespaces, options["requests"], options["threshold"], options["seed"], options["warmup"])
+            elif options["suite"] == "concurrency":
+                results = run_concurrency_benchmarks(
+                    options["articles"], namespaces, options["requests"], options["concurrency"], options["seed"], options["warmup"])
+            elif options["suite"] == "wire-format":
+                results = run_wire_format_benchmarks(options["requests"], options["seed"], options["warmup"])
+            elif options["suite"] == "objects":
+                results = run_object_benchmarks(options["objects"])
+            elif options["suite"] == "scaling":
+                results = run_scaling_benchmarks(sizes, namespaces, options["requests"], options["seed"], options["warmup"])
+            else:
+                results = run_benchmarks(options["articles"], namespaces, options["requests"], options["seed"], options["warmup"])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        output = json.dumps(results, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as file:
+                file.write(output + "\n")
+        else:
+            self.stdout.write(output)
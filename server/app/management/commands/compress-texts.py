@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from app.models import Article, bulk_update_articles
+
+class Command(BaseCommand):
+    help = "Compresses or decompresses the stored texts of all articles according to ARTICLE_TEXT_COMPRESSION_THRESHOLD"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500,
+            help="Number of articles updated per transaction")
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be positive")
+
+        count = 0
+        stored_bytes_before = 0
+        stored_bytes_after = 0
+        last_pk = 0
+        while True:
+            # Read and written in one transaction, whose lock keeps concurrent
+            # writes from being overwritten with the texts read here
+            with transaction.atomic():
+                batch = list(Article.objects.select_for_update()
+                    .filter(pk__gt=last_pk).order_by("pk").only("text", "compressed_text")[:options["batch_size"]])
+                if not batch:
+                    break
+
+                changed = []
+                for article in batch:
+                    compressed_text = article.compressed_text
+                    stored_bytes_before += stored_size(article)
+                    article.update_compressed_text()
+                    stored_bytes_after += stored_size(article)
+                    if article.compressed_text != compressed_text:
+                        changed.append(article)
+
+                bulk_update_articles(changed, ["text"])
+
+            count += len(changed)
+            last_pk = batch[-1].pk
+
+        self.stdout.write("Converted %d texts, %d bytes stored before, %d bytes after (threshold: %s)" % (
+            count, stored_bytes_before, stored_bytes_after, settings.ARTICLE_TEXT_COMPRESSION_THRESHOLD))
+
+def stored_size(article):
+    if article.compressed_text is not None:
+        return len(article.compressed_text)
+    return len(article.text.encode())
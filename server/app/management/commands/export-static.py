@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+
+import json
+import os
+import shutil
+from urllib.parse import quote
+
+from django.core.management.base import BaseCommand, CommandError
+from app.domain.locator import LocatorSerializationService
+from app.models import Article
+from app.permissions import crosscutt_permissions, readable_namespaces
+from app.views import MAX_PREVIEWS_PAGE_SIZE, article_json, getPreviewsPageJson, serialize_article_data
+
+MANIFEST = "manifest.json"
+
+class Command(BaseCommand):
+    help = "Exports the previews and articles of every namespace readable by a user into static JSON files"
+
+    def add_arguments(self, parser):
+        parser.add_argument("directory", nargs=1, type=str)
+        parser.add_argument("--user", type=str, default=None,
+            help="User whose permissions apply, anonymous by default")
+        parser.add_argument("--page-size", type=int, default=MAX_PREVIEWS_PAGE_SIZE,
+            help="Number of previews per page")
+        parser.add_argument("--format", type=str, choices=["1", "2"], default="1",
+            help="Wire format of the article files")
+        parser.add_argument("--batch-size", type=int, default=500,
+            help="Number of articles loaded at once")
+        parser.add_argument("--full", action="store_true",
+            help="Rewrite all files instead of only those of changed articles")
+
+    def handle(self, *args, **options):
+        if options["page_size"] < 1 or options["batch_size"] < 1:
+            raise CommandError("--page-size and --batch-size must be positive")
+
+        summary = ExportSummary()
+        namespaces = readable_namespaces(options["user"])
+        for namespace in namespaces:
+            exporter = NamespaceExporter(
+                os.path.join(options["directory"][0], namespace), namespace,
+                crosscutt_permissions(options["user"], namespace), options, summary)
+            exporter.export()
+        remove_namespaces(options["directory"][0], namespaces, summary)
+
+        self.stdout.write("Wrote %d articles (%d unchanged), %d preview pages and removed %d files" % (
+            summary.written, summary.unchanged, summary.pages, summary.removed))
+
+class ExportSummary:
+    def __init__(self):
+        self.written = 0
+        self.unchanged = 0
+        self.pages = 0
+        self.removed = 0
+
+# Writes <namespace>/previews/<page>.json in the shape of paged get_previews
+# responses, with the file of the next page in "next_page", and one
+# <namespace>/articles/<name>.json per ID and title in the shape of get_article
+# responses. The manifest remembers the version of every exported article, so
+# that the next export only rewrites the files of articles changed since, as
+# long as the files were written in the same format and with the same
+# permissions, which are part of every article file.
+class NamespaceExporter:
+    def __init__(self, directory, namespace, permissions, options, summary):
+        self.directory = directory
+        self.namespace = namespace
+        self.permissions = permissions
+        self.options = options
+        self.summary = summary
+
+    def export(self):
+        os.makedirs(os.path.join(self.directory, "previews"), exist_ok=True)
+        os.makedirs(os.path.join(self.directory, "articles"), exist_ok=True)
+
+        manifest = self.read_manifest()
+        full = self.options["full"] or \
+            manifest.get("format") != self.options["format"] or manifest.get("permissions") != self.permissions
+        exported = {}
+        changed = []
+        for pk, article_id, title, version in Article.objects \
+                .filter(namespace=self.namespace) \
+                .values_list("pk", "article_id", "title", "version") \
+                .iterator():
+            entry = {
+                "version": version,
+                "files": sorted(article_file_name(name) for name in {article_id, title} - {None}),
+            }
+            exported[str(pk)] = entry
+            if full or manifest["articles"].get(str(pk)) != entry:
+                changed.append(pk)
+            else:
+                self.summary.unchanged += 1
+
+        self.write_articles(changed)
+        self.remove_files("articles", {name for entry in manifest["articles"].values() for name in entry["files"]} -
+            {name for entry in exported.values() for name in entry["files"]})
+
+        pages = self.write_previews()
+        self.remove_files("previews", set(manifest["pages"]) - set(pages))
+
+        # Written last, so that an interrupted export is repeated the next time
+        write_file(os.path.join(self.directory, MANIFEST), json.dumps({
+            "format": self.options["format"],
+            "permissions": self.permissions,
+            "articles": exported,
+            "pages": pages,
+        }))
+
+    def read_manifest(self):
+        try:
+            with open(os.path.join(self.directory, MANIFEST)) as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return { "articles": {}, "pages": [] }
+
+    def write_articles(self, pks):
+        for start in range(0, len(pks), self.options["batch_size"]):
+            for article in Article.objects.filter(pk__in=pks[start:start + self.options["batch_size"]]):
+                content = article_json(self.options["format"], serialize_article_data(article), self.permissions)
+                for name in article.get_name_set():
+                    write_file(os.path.join(self.directory, "articles", article_file_name(name)), content)
+                self.summary.written += 1
+
+    # Preview pages hold no texts and are cheap to build, so they are always
+    # built, but only written if they changed
+    def write_previews(self):
+        pages = []
+        after = None
+        while True:
+            page = getPreviewsPageJson([self.namespace], after, self.options["page_size"])
+            name = "page-%d.json" % len(pages)
+            pages.append(name)
+            page["next_page"] = "page-%d.json" % len(pages) if page["next"] is not None else None
+            if write_file(os.path.join(self.directory, "previews", name), json.dumps(page), only_if_changed=True):
+                self.summary.pages += 1
+
+            if page["next"] is None:
+                return pages
+            after = LocatorSerializationService.deserialize(page["next"])
+
+    def remove_files(self, subdirectory, names):
+        for name in names:
+            try:
+                os.remove(os.path.join(self.directory, subdirectory, name))
+                self.summary.removed += 1
+            except FileNotFoundError:
+                pass
+
+# Removes the exports of namespaces that the user cannot read any more, which
+# are the directories with a manifest that were not exported this time
+def remove_namespaces(directory, namespaces, summary):
+    if not os.path.isdir(directory):
+        return
+    for entry in os.scandir(directory):
+        if entry.is_dir() and entry.name not in namespaces and os.path.exists(os.path.join(entry.path, MANIFEST)):
+            summary.removed += sum(len(files) for _, _, files in os.walk(entry.path))
+            shutil.rmtree(entry.path)
+
+# Names may contain slashes and other characters that file systems or URLs do
+# not like, so they are percent-encoded. Clients have to encode the file name
+# once more when putting it into a URL.
+def article_file_name(name):
+    return quote(name, safe="") + ".json"
+
+# Replaces the file at once, so that the file server never serves half a file.
+# Returns whether the file was written.
+def write_file(path, content, only_if_changed=False):
+    if only_if_changed:
+        try:
+            with open(path, encoding="utf-8") as file:
+                if file.read() == content:
+                    return False
+        except FileNotFoundError:
+            pass
+
+    with open(path + ".tmp", "w", encoding="utf-8") as file:
+        file.write(content)
+    os.replace(path + ".tmp", path)
+    return True
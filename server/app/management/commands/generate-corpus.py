@@ -0,0 +1,26 @@
+#!/usr/bin/env python
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from app.corpus import generate_corpus
+
+class Command(BaseCommand):
+    help = "Writes synthetic articles, e.g. to try out or benchmark the API with a corpus of a given size"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--articles", type=int, default=1000,
+            help="Number of articles to generate")
+        parser.add_argument("--namespaces", type=str, default="public",
+            help="Comma-separated namespaces to spread the articles over")
+        parser.add_argument("--seed", type=int, default=0,
+            help="Seed of the generator, the same seed produces the same articles")
+
+    def handle(self, *args, **options):
+        namespaces = [namespace for namespace in options["namespaces"].split(",") if namespace]
+        if options["articles"] < 0 or not namespaces:
+            raise CommandError("--articles must not be negative and --namespaces must not be empty")
+
+        started_at = time.monotonic()
+        generate_corpus(options["articles"], namespaces, options["seed"])
+        self.stdout.write("Generated %d articles in %.1fs" % (options["articles"], time.monotonic() - started_at))
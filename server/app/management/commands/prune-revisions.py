@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count
+from app.models import ArticleRevision
+
+class Command(BaseCommand):
+    help = "Deletes all but the latest revisions of every article"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--keep", type=int, default=100,
+            help="Number of revisions kept per article, including the current version")
+
+    def handle(self, *args, **options):
+        if options["keep"] < 1:
+            raise CommandError("--keep must be positive")
+
+        article_pks = ArticleRevision.objects \
+            .values("article_id") \
+            .annotate(count=Count("pk")) \
+            .filter(count__gt=options["keep"]) \
+            .values_list("article_id", flat=True)
+
+        deleted = 0
+        for article_pk in list(article_pks):
+            with transaction.atomic():
+                deleted += prune_revisions(article_pk, options["keep"])
+
+        self.stdout.write("Deleted %d revisions" % deleted)
+
+# The oldest revision that is kept becomes a snapshot, since the revisions its
+# delta is based on are deleted
+def prune_revisions(article_pk, keep):
+    revisions = ArticleRevision.objects.filter(article_id=article_pk)
+    oldest_kept = revisions.defer("data").order_by("-version")[keep - 1]
+    if not oldest_kept.is_snapshot:
+        oldest_kept.make_snapshot()
+        oldest_kept.save(update_fields=["data", "is_snapshot"])
+
+    deleted, _ = revisions.filter(version__lt=oldest_kept.version).delete()
+    return deleted
@@ -1,49 +1,178 @@
 #!/usr/bin/env python
 
 import json
-from datetime import datetime
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from itertools import islice
 
 from django.core.management.base import BaseCommand, CommandError
-from app.models import Article
+from django.db import transaction
+from app.models import ArticleName, ArticleRevision, bulk_create_articles, bulk_update_articles, make_revision
+from app.tiddlers import NAMESPACE, prepare_batch, setup_worker
 
 class Command(BaseCommand):
     help = "Imports tiddlers exported in JSON from a TiddlyWiki5"
 
     def add_arguments(self, parser):
         parser.add_argument("filename", nargs=1, type=str)
+        parser.add_argument("--batch-size", type=int, default=500,
+            help="Number of tiddlers written per transaction")
+        parser.add_argument("--upsert", action="store_true",
+            help="Update articles whose title is already taken instead of skipping the tiddler")
+        parser.add_argument("--workers", type=int, default=1,
+            help="Number of processes converting and validating tiddlers")
 
     def handle(self, *args, **options):
-        tiddlers = import_tiddlers(options["filename"][0])
+        if options["batch_size"] < 1 or options["workers"] < 1:
+            raise CommandError("--batch-size and --workers must be positive")
 
-        for tiddler in tiddlers:
-            article = Article(
-                article_id=None,
-                title=tiddler["title"],
-                text=tiddler["text"],
-                created_at=parse_tiddler_date(tiddler["created"]),
-                last_modified_at=parse_tiddler_date(tiddler["modified"]))
+        summary = ImportSummary()
+        started_at = time.monotonic()
 
-            if tiddler["title"] == "Robin Hartshorne: Algebraic Geometry":
-                continue
+        batches = iter_batches(import_tiddlers(options["filename"][0]), options["batch_size"])
+        if options["workers"] > 1:
+            prepared_batches = prepare_in_pool(batches, options["workers"])
+        else:
+            prepared_batches = map(prepare_batch, batches)
 
-            print(tiddler)
-            article.full_clean()
-            article.save()
+        # Only this process writes to the database, in the order of the file
+        for articles in prepared_batches:
+            write_batch(articles, options["upsert"], summary)
+            if options["verbosity"] >= 2:
+                self.stdout.write("%d tiddlers processed" % summary.total())
+
+        for title in summary.skipped:
+            self.stdout.write("Skipped " + title + ": title is already taken")
+
+        duration = time.monotonic() - started_at
+        self.stdout.write("Imported %d tiddlers (%d created, %d updated, %d skipped) in %.1fs, %.0f tiddlers/s" % (
+            summary.total(), summary.created, summary.updated, len(summary.skipped),
+            duration, summary.total() / duration if duration > 0 else 0))
+
+class ImportSummary:
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.skipped = []
+
+    def total(self):
+        return self.created + self.updated + len(self.skipped)
+
+def iter_batches(tiddlers, batch_size):
+    while True:
+        batch = list(islice(tiddlers, batch_size))
+        if not batch:
+            return
+        yield batch
+
+# Prepares the batches in worker processes, with the functions of
+# app.tiddlers, which work with every start method. Results are yielded in the
+# order of the batches and at most two batches per worker are in flight, so
+# that a slow writer holds back the reader instead of piling up prepared
+# batches.
+def prepare_in_pool(batches, workers):
+    with ProcessPoolExecutor(workers, initializer=setup_worker) as pool:
+        pending = deque()
+        for batch in batches:
+            pending.append(pool.submit(prepare_batch, batch))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
+
+def write_batch(prepared_articles, upsert, summary):
+    articles = {}
+    for article in prepared_articles:
+        if article.title in articles:
+            summary.skipped.append(article.title)
+        else:
+            articles[article.title] = article
+
+    with transaction.atomic():
+        taken = {
+            name: (pk, title, article_id, version)
+            for name, pk, title, article_id, version in ArticleName.objects
+                .filter(namespace=NAMESPACE, name__in=articles.keys())
+                .values_list("name", "article__pk", "article__title", "article__article_id", "article__version")
+        }
+
+        now = datetime.now(timezone.utc)
+        created = []
+        updated = []
+        for title, article in articles.items():
+            if title not in taken:
+                created.append(article)
+            elif upsert and taken[title][1] == title:
+                pk, _, article_id, version = taken[title]
+                article.pk = pk
+                article.article_id = article_id
+                article.version = version + 1
+                # The update is a change here, whenever the tiddler was modified
+                article.last_modified_at = now
+                article.changed_at = now
+                article.update_preview()
+                updated.append(article)
+            else:
+                summary.skipped.append(title)
+
+        bulk_create_articles(created)
+        bulk_update_articles(updated, ["text", "preview", "last_modified_at", "changed_at", "version"])
+        # The replaced texts are not loaded, so updates are recorded as snapshots
+        # Servers run in other processes, whose caches forget the old texts
+        # after ARTICLE_CACHE_MAX_AGE_SECONDS
+        ArticleRevision.objects.bulk_create([make_revision(article) for article in updated])
+
+    summary.created += len(created)
+    summary.updated += len(updated)
+
+# Decodes the exported JSON array one tiddler at a time, so that the file
+# never has to be in memory as a whole
+def import_tiddlers(filename, chunk_size=64 * 1024):
+    decoder = json.JSONDecoder()
 
-def import_tiddlers(filename):
     with open(filename) as tiddlerFile:
-        jsonEncodedTiddlers = tiddlerFile.read()
+        buffer = ""
+        position = 0
+
+        def read_more():
+            nonlocal buffer, position
+            chunk = tiddlerFile.read(chunk_size)
+            if not chunk:
+                raise CommandError("Unexpected end of " + filename)
+            buffer = buffer[position:] + chunk
+            position = 0
 
-    return json.loads(jsonEncodedTiddlers)
+        def next_character():
+            nonlocal position
+            while True:
+                while position < len(buffer) and buffer[position].isspace():
+                    position += 1
+                if position < len(buffer):
+                    return buffer[position]
+                read_more()
 
-def parse_tiddler_date(string):
-    year = int(string[0:4])
-    month = int(string[4:6])
-    day = int(string[6:8])
-    hour = int(string[8:10])
-    minute = int(string[10:12])
-    second = int(string[12:14])
-    millisecond = int(string[14:17])
+        if next_character() != "[":
+            raise CommandError(filename + " does not contain a JSON array")
+        position += 1
+        if next_character() == "]":
+            return
 
-    return datetime(year, month, day, hour, minute, second, millisecond * 1000)
+        while True:
+            next_character()
+            while True:
+                try:
+                    tiddler, position = decoder.raw_decode(buffer, position)
+                    break
+                except json.JSONDecodeError:
+                    read_more()
+            yield tiddler
 
+            separator = next_character()
+            position += 1
+            if separator == "]":
+                return
+            if separator != ",":
+                raise CommandError("Malformed JSON array in " + filename)
@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from app.models import Article
+
+class Command(BaseCommand):
+    help = "Recomputes the stored previews of all articles, e.g. after the way previews are made has changed"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500,
+            help="Number of articles updated per transaction")
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be positive")
+
+        count = 0
+        last_pk = 0
+        while True:
+            # Read and written in one transaction, so that a concurrent change
+            # never gets the preview of the text it replaced
+            with transaction.atomic():
+                batch = list(Article.objects.select_for_update()
+                    .filter(pk__gt=last_pk).order_by("pk").only("text", "compressed_text", "preview")[:options["batch_size"]])
+                if not batch:
+                    break
+
+                changed = []
+                now = timezone.now()
+                for article in batch:
+                    preview = article.preview
+                    article.update_preview()
+                    if article.preview != preview:
+                        # Invalidates the previews of clients and shows up in the change feed
+                        article.changed_at = now
+                        changed.append(article)
+
+                Article.objects.bulk_update(changed, ["preview", "changed_at"])
+
+            count += len(changed)
+            last_pk = batch[-1].pk
+
+        self.stdout.write("Updated %d previews" % count)
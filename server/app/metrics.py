@@ -0,0 +1,127 @@
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from .cache import article_cache, compressed_response_cache
+
+# Upper bounds of the latency buckets in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    # Cumulative counts by upper bound, as Prometheus expects them
+    def get_buckets(self):
+        cumulative = 0
+        for bound, count in zip([*map(str, self.buckets), "+Inf"], self.counts):
+            cumulative += count
+            yield bound, cumulative
+
+class ViewMetrics:
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.response_bytes = 0
+
+# Request metrics by URL name, see app.middleware.MetricsMiddleware, and the
+# durations of sections of code measured with measure().
+class MetricsRegistry:
+    def __init__(self):
+        self.views = defaultdict(ViewMetrics)
+        self.sections = defaultdict(lambda: Histogram(LATENCY_BUCKETS))
+        self.lock = threading.Lock()
+
+    def record_request(self, view, seconds, queries, query_seconds, response_bytes):
+        with self.lock:
+            metrics = self.views[view]
+            metrics.latency.observe(seconds)
+            metrics.queries += queries
+            metrics.query_seconds += query_seconds
+            metrics.response_bytes += response_bytes
+
+    # Streamed responses are counted while they are sent, after the request
+    # has been recorded
+    def record_response_bytes(self, view, response_bytes):
+        with self.lock:
+            self.views[view].response_bytes += response_bytes
+
+    def record_section(self, section, seconds):
+        with self.lock:
+            self.sections[section].observe(seconds)
+
+    def clear(self):
+        with self.lock:
+            self.views.clear()
+            self.sections.clear()
+
+    # The metrics in the text format of Prometheus
+    def render(self):
+        lines = []
+        with self.lock:
+            render_histogram(lines, "crosscutt_request_duration_seconds", "Request latency by URL name", "view",
+                {view: metrics.latency for view, metrics in self.views.items()})
+            render_counter(lines, "crosscutt_db_queries_total", "Database queries by URL name", "view",
+                {view: metrics.queries for view, metrics in self.views.items()})
+            render_counter(lines, "crosscutt_db_query_duration_seconds_total", "Time spent in database queries by URL name", "view",
+                {view: metrics.query_seconds for view, metrics in self.views.items()})
+            render_counter(lines, "crosscutt_response_bytes_total", "Response body bytes by URL name", "view",
+                {view: metrics.response_bytes for view, metrics in self.views.items()})
+            render_histogram(lines, "crosscutt_section_duration_seconds", "Duration of measured sections of code", "section",
+                self.sections)
+
+        for cache_name, cache in [("article", article_cache), ("compressed_response", compressed_response_cache)]:
+            stats = cache.get_stats()
+            description = cache_name.replace("_", " ").capitalize() + " cache "
+            for name in ["hits", "misses", "evictions"]:
+                render_counter(lines, "crosscutt_%s_cache_%s_total" % (cache_name, name), description + name, None, { None: stats[name] })
+            for name in ["entries", "bytes"]:
+                render_gauge(lines, "crosscutt_%s_cache_%s" % (cache_name, name), description + name, { None: stats[name] })
+
+        return "\n".join(lines) + "\n"
+
+def render_histogram(lines, name, help, label, histograms):
+    lines.append("# HELP %s %s" % (name, help))
+    lines.append("# TYPE %s histogram" % name)
+    for value, histogram in sorted(histograms.items()):
+        labels = "%s=%s" % (label, quote_label(value))
+        for bound, count in histogram.get_buckets():
+            lines.append('%s_bucket{%s,le="%s"} %d' % (name, labels, bound, count))
+        lines.append("%s_sum{%s} %r" % (name, labels, histogram.sum))
+        lines.append("%s_count{%s} %d" % (name, labels, histogram.count))
+
+def render_counter(lines, name, help, label, values):
+    render_samples(lines, name, help, "counter", label, values)
+
+def render_gauge(lines, name, help, values):
+    render_samples(lines, name, help, "gauge", None, values)
+
+def render_samples(lines, name, help, type, label, values):
+    lines.append("# HELP %s %s" % (name, help))
+    lines.append("# TYPE %s %s" % (name, type))
+    for value, sample in sorted(values.items(), key=lambda item: str(item[0])):
+        labels = "{%s=%s}" % (label, quote_label(value)) if label is not None else ""
+        lines.append("%s%s %r" % (name, labels, sample))
+
+def quote_label(value):
+    return '"' + str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+
+metrics = MetricsRegistry()
+
+@contextmanager
+def measure(section):
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.record_section(section, time.perf_counter() - started_at)
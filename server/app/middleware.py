@@ -0,0 +1,145 @@
+import asyncio
+import cProfile
+import io
+import logging
+import pstats
+import random
+import time
+from contextvars import ContextVar
+from django.conf import settings
+from django.urls import Resolver404, resolve
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Records the latency, the database queries and the response size of every
+# request by the name of its URL pattern. Queries slower than
+# CROSSCUTT_SLOW_QUERY_SECONDS are logged. A sample of the requests to the
+# URL names in CROSSCUTT_PROFILE_URL_NAMES runs under cProfile, whose
+# statistics are logged as well.
+#
+# Runs in the mode of the handler, so that ASGI requests are not passed
+# through a thread on their way to the async views. The queries of async
+# views run in other threads, so they are recorded by a wrapper on every
+# connection, see install_query_recorder, which finds the QueryRecorder of the
+# request in a context variable. Async requests are not profiled, since
+# cProfile only sees the thread it runs in.
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Makes Django treat the instance as a coroutine function
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.async_call(request)
+
+        queries = QueryRecorder(settings.CROSSCUTT_SLOW_QUERY_SECONDS)
+        profiler = cProfile.Profile() if is_profiled(request) else None
+        started_at = time.perf_counter()
+
+        token = current_queries.set(queries)
+        try:
+            if profiler is not None:
+                profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                if profiler is not None:
+                    profiler.disable()
+        finally:
+            current_queries.reset(token)
+
+        view = record_request(request, response, queries, time.perf_counter() - started_at)
+        if profiler is not None:
+            log_profile(request, view, profiler)
+
+        return response
+
+    async def async_call(self, request):
+        queries = QueryRecorder(settings.CROSSCUTT_SLOW_QUERY_SECONDS)
+        started_at = time.perf_counter()
+
+        token = current_queries.set(queries)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_queries.reset(token)
+
+        record_request(request, response, queries, time.perf_counter() - started_at)
+        return response
+
+def record_request(request, response, queries, seconds):
+    view = get_view_name(request)
+    if response.streaming:
+        response.streaming_content = count_bytes(view, response.streaming_content)
+        response_bytes = 0
+    else:
+        response_bytes = len(response.content)
+    metrics.record_request(view, seconds, queries.count, queries.seconds, response_bytes)
+    return view
+
+# The QueryRecorder of the request being served, which sync_to_async carries
+# over into the threads that run the queries of async views
+current_queries = ContextVar("current_queries", default=None)
+
+def record_query(execute, sql, params, many, context):
+    queries = current_queries.get()
+    if queries is None:
+        return execute(sql, params, many, context)
+    return queries(execute, sql, params, many, context)
+
+# Installed on every connection through the connection_created signal, see
+# app.apps. The signal is sent again when a connection reconnects, while its
+# wrappers are kept.
+def install_query_recorder(connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+class QueryRecorder:
+    def __init__(self, slow_query_seconds):
+        self.slow_query_seconds = slow_query_seconds
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started_at = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            seconds = time.perf_counter() - started_at
+            self.count += 1
+            self.seconds += seconds
+            if self.slow_query_seconds is not None and seconds >= self.slow_query_seconds:
+                logger.warning("Slow query (%.3fs) on %s: %s", seconds, context["connection"].alias, sql)
+
+# The URL name is only known after the URL has been resolved, which happens
+# within get_response
+def get_view_name(request):
+    match = getattr(request, "resolver_match", None)
+    if match is None or match.url_name is None:
+        return "unresolved"
+    return match.url_name
+
+def is_profiled(request):
+    if settings.CROSSCUTT_PROFILE_SAMPLE_RATE <= 0 or not settings.CROSSCUTT_PROFILE_URL_NAMES:
+        return False
+    try:
+        url_name = resolve(request.path_info).url_name
+    except Resolver404:
+        return False
+    return url_name in settings.CROSSCUTT_PROFILE_URL_NAMES and random.random() < settings.CROSSCUTT_PROFILE_SAMPLE_RATE
+
+def count_bytes(view, chunks):
+    for chunk in chunks:
+        metrics.record_response_bytes(view, len(chunk))
+        yield chunk
+
+def log_profile(request, view, profiler):
+    output = io.StringIO()
+    pstats.Stats(profiler, stream=output).sort_stats("cumulative").print_stats(settings.CROSSCUTT_PROFILE_LINES)
+    logger.info("Profile of %s %s (%s):\n%s", request.method, request.get_full_path(), view, output.getvalue())
@@ -0,0 +1,39 @@
+# Generated by Django 3.1.14 on 2026-10-18 00:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def create_article_names(apps, schema_editor):
+    Article = apps.get_model('app', 'Article')
+    ArticleName = apps.get_model('app', 'ArticleName')
+    db_alias = schema_editor.connection.alias
+    ArticleName.objects.using(db_alias).bulk_create([
+        ArticleName(namespace=article.namespace, name=name, article=article)
+        for article in Article.objects.using(db_alias).only('namespace', 'article_id', 'title').iterator()
+        for name in {article.article_id, article.title} - {None}
+    ], batch_size=500, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0010_auto_20201001_2040'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArticleName',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('namespace', models.CharField(max_length=255)),
+                ('name', models.CharField(max_length=255)),
+                ('article', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='names', to='app.article')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='articlename',
+            constraint=models.UniqueConstraint(fields=('namespace', 'name'), name='unique_name'),
+        ),
+        migrations.RunPython(create_article_names, migrations.RunPython.noop),
+    ]
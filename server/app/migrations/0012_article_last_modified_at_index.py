@@ -0,0 +1,19 @@
+# Generated by Django 3.1.14 on 2026-10-18 00:08
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0011_articlename'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='article',
+            name='last_modified_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+    ]
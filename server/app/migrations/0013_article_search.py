@@ -0,0 +1,51 @@
+from django.db import migrations
+
+
+# Full-text index over the titles and texts of articles, kept up to date by
+# triggers so that every way of writing articles, including bulk writes,
+# updates it. Only available on SQLite, which has FTS5.
+CREATE_SEARCH_INDEX = [
+    """CREATE VIRTUAL TABLE app_article_search USING fts5(
+        title, text, content='app_article', content_rowid='id')""",
+    """CREATE TRIGGER app_article_search_insert AFTER INSERT ON app_article BEGIN
+        INSERT INTO app_article_search(rowid, title, text) VALUES (new.id, new.title, new.text);
+    END""",
+    """CREATE TRIGGER app_article_search_delete AFTER DELETE ON app_article BEGIN
+        INSERT INTO app_article_search(app_article_search, rowid, title, text) VALUES ('delete', old.id, old.title, old.text);
+    END""",
+    """CREATE TRIGGER app_article_search_update AFTER UPDATE OF title, text ON app_article BEGIN
+        INSERT INTO app_article_search(app_article_search, rowid, title, text) VALUES ('delete', old.id, old.title, old.text);
+        INSERT INTO app_article_search(rowid, title, text) VALUES (new.id, new.title, new.text);
+    END""",
+    "INSERT INTO app_article_search(app_article_search) VALUES ('rebuild')",
+]
+
+DROP_SEARCH_INDEX = [
+    "DROP TRIGGER app_article_search_update",
+    "DROP TRIGGER app_article_search_delete",
+    "DROP TRIGGER app_article_search_insert",
+    "DROP TABLE app_article_search",
+]
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for statement in CREATE_SEARCH_INDEX:
+            schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for statement in DROP_SEARCH_INDEX:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0012_article_last_modified_at_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
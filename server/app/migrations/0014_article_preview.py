@@ -0,0 +1,34 @@
+# Generated by Django 3.1.14 on 2026-10-18 00:13
+
+from django.db import migrations, models
+
+from app.domain.preview import make_preview
+
+
+def fill_previews(apps, schema_editor):
+    Article = apps.get_model('app', 'Article')
+    db_alias = schema_editor.connection.alias
+    articles = []
+    for article in Article.objects.using(db_alias).only('text').iterator():
+        article.preview = make_preview(article.text)
+        articles.append(article)
+        if len(articles) == 500:
+            Article.objects.using(db_alias).bulk_update(articles, ['preview'])
+            articles = []
+    Article.objects.using(db_alias).bulk_update(articles, ['preview'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0013_article_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='article',
+            name='preview',
+            field=models.CharField(blank=True, default='', max_length=200),
+        ),
+        migrations.RunPython(fill_previews, migrations.RunPython.noop),
+    ]
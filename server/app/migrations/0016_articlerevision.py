@@ -0,0 +1,51 @@
+# Generated by Django 3.1.14 on 2026-10-18 00:19
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+from app.domain.delta import compress_text
+
+
+# Starts the history of every article with a snapshot of its current version
+def create_snapshots(apps, schema_editor):
+    Article = apps.get_model('app', 'Article')
+    ArticleRevision = apps.get_model('app', 'ArticleRevision')
+    db_alias = schema_editor.connection.alias
+    revisions = []
+    for article in Article.objects.using(db_alias).iterator():
+        revisions.append(ArticleRevision(
+            article=article, version=article.version, namespace=article.namespace, identifier=article.article_id,
+            title=article.title, created_at=article.last_modified_at, is_snapshot=True, data=compress_text(article.text)))
+        if len(revisions) == 500:
+            ArticleRevision.objects.using(db_alias).bulk_create(revisions)
+            revisions = []
+    ArticleRevision.objects.using(db_alias).bulk_create(revisions)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0015_article_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArticleRevision',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField()),
+                ('namespace', models.CharField(max_length=255)),
+                ('identifier', models.CharField(blank=True, max_length=255, null=True)),
+                ('title', models.CharField(max_length=255)),
+                ('created_at', models.DateTimeField()),
+                ('is_snapshot', models.BooleanField()),
+                ('data', models.BinaryField()),
+                ('article', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='revisions', to='app.article')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='articlerevision',
+            constraint=models.UniqueConstraint(fields=('article', 'version'), name='unique_revision'),
+        ),
+        migrations.RunPython(create_snapshots, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,82 @@
+# Generated by Django 3.1.14 on 2026-10-18 00:22
+
+import importlib
+
+import app.models
+from django.db import migrations, models
+
+
+# The search index reads texts through a view from now on, which decompresses
+# compressed texts with the crosscutt_article_text function registered by
+# app.search. The view is dropped again at the end, since it would break later
+# migrations that rebuild the article table, and restored after migrating.
+CREATE_SEARCH_INDEX = [
+    "DROP TRIGGER IF EXISTS app_article_search_update",
+    "DROP TRIGGER IF EXISTS app_article_search_delete",
+    "DROP TRIGGER IF EXISTS app_article_search_insert",
+    "DROP TABLE app_article_search",
+    """CREATE VIRTUAL TABLE app_article_search USING fts5(
+        title, text, content='app_article_search_content', content_rowid='id')""",
+    """CREATE VIEW app_article_search_content AS
+        SELECT id, title, crosscutt_article_text(text, compressed_text) AS text FROM app_article""",
+    """CREATE TRIGGER app_article_search_insert AFTER INSERT ON app_article BEGIN
+        INSERT INTO app_article_search(rowid, title, text)
+            VALUES (new.id, new.title, crosscutt_article_text(new.text, new.compressed_text));
+    END""",
+    """CREATE TRIGGER app_article_search_delete AFTER DELETE ON app_article BEGIN
+        INSERT INTO app_article_search(app_article_search, rowid, title, text)
+            VALUES ('delete', old.id, old.title, crosscutt_article_text(old.text, old.compressed_text));
+    END""",
+    """CREATE TRIGGER app_article_search_update AFTER UPDATE OF title, text, compressed_text ON app_article BEGIN
+        INSERT INTO app_article_search(app_article_search, rowid, title, text)
+            VALUES ('delete', old.id, old.title, crosscutt_article_text(old.text, old.compressed_text));
+        INSERT INTO app_article_search(rowid, title, text)
+            VALUES (new.id, new.title, crosscutt_article_text(new.text, new.compressed_text));
+    END""",
+    "INSERT INTO app_article_search(app_article_search) VALUES ('rebuild')",
+    "DROP VIEW app_article_search_content",
+]
+
+DROP_SEARCH_INDEX = [
+    "DROP TRIGGER IF EXISTS app_article_search_update",
+    "DROP TRIGGER IF EXISTS app_article_search_delete",
+    "DROP TRIGGER IF EXISTS app_article_search_insert",
+    "DROP VIEW IF EXISTS app_article_search_content",
+    "DROP TABLE app_article_search",
+]
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for statement in CREATE_SEARCH_INDEX:
+            schema_editor.execute(statement)
+
+
+# Back to the index of migration 0013, which requires uncompressed texts
+def restore_previous_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for statement in DROP_SEARCH_INDEX:
+            schema_editor.execute(statement)
+        for statement in importlib.import_module('app.migrations.0013_article_search').CREATE_SEARCH_INDEX:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0016_articlerevision'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='article',
+            name='compressed_text',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='article',
+            name='text',
+            field=app.models.ArticleTextField(blank=True),
+        ),
+        migrations.RunPython(create_search_index, restore_previous_search_index),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 3.1.14 on 2026-10-18 01:05
+
+from django.db import migrations, models
+from django.db.models import F
+import django.utils.timezone
+
+
+# Until now, the change feed paged by last_modified_at
+def copy_last_modified_at(apps, schema_editor):
+    Article = apps.get_model('app', 'Article')
+    Article.objects.using(schema_editor.connection.alias).update(changed_at=F('last_modified_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0017_article_compressed_text'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='article',
+            name='changed_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.RunPython(copy_last_modified_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='article',
+            index=models.Index(fields=['changed_at', 'id'], name='article_changed_at'),
+        ),
+    ]
@@ -1,21 +1,337 @@
-from django.db import models
+import copy
+
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import Max, Subquery
+from django.db.models.query_utils import DeferredAttribute
 from django.utils import timezone
+from .cache import article_cache
+from .domain.delta import make_delta, apply_delta, compress_text, decompress_text, compress_delta, decompress_delta
+from .domain.preview import PREVIEW_LENGTH, make_preview
+
+# Largest number of names looked up with one query, SQLite limits the number
+# of query parameters
+NAMES_QUERY_CHUNK_SIZE = 500
+
+# Texts of at least ARTICLE_TEXT_COMPRESSION_THRESHOLD characters are stored
+# compressed in Article.compressed_text, while the text column is left empty.
+# They are only decompressed when the text of the article is accessed.
+class ArticleTextDescriptor(DeferredAttribute):
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+        data = instance.__dict__
+        if self.field.attname not in data and "compressed_text" not in data:
+            instance.refresh_from_db(fields=[self.field.attname, "compressed_text"])
+        if self.field.attname not in data and data["compressed_text"] is not None:
+            data[self.field.attname] = decompress_text(data["compressed_text"])
+        return super().__get__(instance, cls)
+
+class ArticleTextField(models.TextField):
+    descriptor_class = ArticleTextDescriptor
+
+    def pre_save(self, model_instance, add):
+        if model_instance.compressed_text is not None:
+            return ""
+        return super().pre_save(model_instance, add)
 
 class Article(models.Model):
 
     class Meta:
         constraints = [
-            # Have to enforce manually that no article_id equals the title of some
-            # (possibly other) article
+            # That no article_id equals the title of some other article is
+            # enforced by the unique_name constraint of ArticleName
             models.UniqueConstraint(fields=["namespace", "article_id"], name="unique_article_id"),
             models.UniqueConstraint(fields=["namespace", "title"], name="unique_title"),
         ]
+        indexes = [
+            models.Index(fields=["changed_at", "id"], name="article_changed_at"),
+        ]
 
     article_id = models.CharField(max_length=255, null=True, blank=True)
     title = models.CharField(max_length=255)
-    text = models.TextField(blank=True)
+    text = ArticleTextField(blank=True)
+    compressed_text = models.BinaryField(null=True, editable=False)
+    preview = models.CharField(max_length=PREVIEW_LENGTH, blank=True, default="")
 
     namespace = models.CharField(max_length=255, default="public")
     created_at = models.DateTimeField(default=timezone.now)
-    last_modified_at = models.DateTimeField(default=timezone.now)
+    last_modified_at = models.DateTimeField(default=timezone.now, db_index=True)
+    # When the article was last written in any way, which the change feed pages
+    # by. Imported articles keep the modification time of the original in
+    # last_modified_at, so that may lie in the past even for new articles.
+    changed_at = models.DateTimeField(default=timezone.now)
+
+    # Incremented by every save. An update only succeeds if the version in the
+    # database still is the one the article had before, which clients can
+    # use to detect concurrent changes, see change_article.
+    version = models.PositiveIntegerField(default=1)
+
+    # Remembers the names the article was loaded with, so that saving can
+    # invalidate them and skip rewriting the name index if they did not change,
+    # and the stored text, which the revision of the next version is based on
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if {"namespace", "article_id", "title"} <= set(field_names):
+            instance._loaded_cache_keys = instance.get_cache_keys()
+        if {"version", "text", "compressed_text"} <= set(field_names):
+            loaded = dict(zip(field_names, values))
+            instance._loaded_text = (loaded["version"], loaded["text"], loaded["compressed_text"])
+        # Left to ArticleTextDescriptor, which decompresses on access
+        if "text" in field_names and instance.__dict__.get("compressed_text") is not None:
+            del instance.__dict__["text"]
+        return instance
+
+    def save(self, *args, **kwargs):
+        loaded_cache_keys = getattr(self, "_loaded_cache_keys", None)
+        cache_keys = self.get_cache_keys()
+
+        with transaction.atomic(savepoint=False):
+            adding = self._state.adding
+            self._expected_version = None if adding else self.version
+            self.changed_at = timezone.now()
+            if not adding:
+                self.last_modified_at = self.changed_at
+                self.version += 1
+            self.update_preview()
+            self.update_compressed_text()
+            old_text = None if adding else self.get_old_text()
+
+            try:
+                super().save(*args, **kwargs)
+            except VersionConflictException:
+                self.version = self._expected_version
+                raise
+            if adding or loaded_cache_keys != cache_keys:
+                if not adding:
+                    self.names.all().delete()
+                ArticleName.objects.bulk_create(self.get_names())
+            make_revision(self, old_text).save()
+
+            stale_cache_keys = cache_keys | (loaded_cache_keys or set())
+            invalidate_cache(stale_cache_keys)
+            transaction.on_commit(lambda: invalidate_cache(stale_cache_keys))
+
+        self._loaded_cache_keys = cache_keys
+        self._loaded_text = (self.version, self.text, None)
+
+    # The stored text of the version that is being overwritten. The loaded text
+    # is only that text if the article was loaded at that version, otherwise
+    # it is read again.
+    def get_old_text(self):
+        loaded = getattr(self, "_loaded_text", None)
+        if loaded is None or loaded[0] != self._expected_version:
+            return get_stored_text(Article.objects.filter(pk=self.pk))
+        version, text, compressed_text = loaded
+        return decompress_text(compressed_text) if compressed_text is not None else text
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        expected_version = getattr(self, "_expected_version", None)
+        if expected_version is None:
+            return super()._do_update(base_qs, using, pk_val, values, update_fields, forced_update)
+
+        updated = super()._do_update(
+            base_qs.filter(version=expected_version), using, pk_val, values, update_fields, forced_update)
+        if not updated and base_qs.filter(pk=pk_val).exists():
+            raise VersionConflictException()
+        return updated
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        invalidate_cache(self.get_cache_keys() | getattr(self, "_loaded_cache_keys", set()))
+        return result
+
+    def update_preview(self):
+        self.preview = make_preview(self.text)
+
+    def update_compressed_text(self):
+        text = self.text
+        self.compressed_text = None
+        threshold = settings.ARTICLE_TEXT_COMPRESSION_THRESHOLD
+        if threshold is not None and len(text) >= threshold:
+            compressed_text = compress_text(text)
+            if len(compressed_text) < len(text):
+                self.compressed_text = compressed_text
+
+    def get_names(self):
+        return [ArticleName(namespace=self.namespace, name=name, article=self) for name in self.get_name_set()]
+
+    def get_name_set(self):
+        return {self.article_id, self.title} - {None}
+
+    def get_cache_keys(self):
+        return {(self.namespace, name) for name in self.get_name_set()}
+
+class VersionConflictException(Exception):
+    pass
+
+# Like bulk_create, but also fills in the name index and invalidates the cache,
+# which Article.save would do for every single article. Must run inside a
+# transaction so that a conflict in the name index rolls back the articles.
+def bulk_create_articles(articles):
+    now = timezone.now()
+    for article in articles:
+        article.changed_at = now
+        article.update_preview()
+        article.update_compressed_text()
+    Article.objects.bulk_create(articles)
+
+    # Not every backend returns the primary keys of bulk inserted rows
+    missing_pks = [article for article in articles if article.pk is None]
+    pks = {}
+    for start in range(0, len(missing_pks), NAMES_QUERY_CHUNK_SIZE):
+        pks.update({
+            (namespace, title): pk
+            for namespace, title, pk in Article.objects
+                .filter(title__in=[article.title for article in missing_pks[start:start + NAMES_QUERY_CHUNK_SIZE]])
+                .values_list("namespace", "title", "pk")
+        })
+    for article in missing_pks:
+        article.pk = pks[(article.namespace, article.title)]
+
+    ArticleName.objects.bulk_create([name for article in articles for name in article.get_names()])
+    ArticleRevision.objects.bulk_create([make_revision(article) for article in articles])
+    invalidate_cache({key for article in articles for key in article.get_cache_keys()})
+
+# Like saving every article after its fields have been changed, for articles
+# loaded from the database, with the text of the articles before the changes
+# by primary key. Must run inside a transaction, see bulk_create_articles.
+# Unlike save, it does not check the versions again, so the articles have to
+# be locked or checked when they are loaded.
+def bulk_change_articles(articles, old_texts):
+    now = timezone.now()
+    for article in articles:
+        article.last_modified_at = now
+        article.changed_at = now
+        article.version += 1
+        article.update_preview()
+
+    renamed = [article for article in articles if article.get_cache_keys() != article._loaded_cache_keys]
+    # Names are deleted first, so that the articles can take each other's names
+    ArticleName.objects.filter(article__in=renamed).delete()
+    # The unique constraints of the articles are checked row by row during the
+    # update, so renamed articles first move to placeholder names, which are
+    # never taken, for the same reason
+    if len(renamed) > 1:
+        Article.objects.bulk_update([placeholder_names(article) for article in renamed], ["article_id", "title"])
+    bulk_update_articles(articles, ["article_id", "title", "text", "namespace", "preview", "last_modified_at", "changed_at", "version"])
+    ArticleName.objects.bulk_create([name for article in renamed for name in article.get_names()])
+    ArticleRevision.objects.bulk_create([make_revision(article, old_texts[article.pk]) for article in articles])
+
+    stale_cache_keys = {key for article in articles for key in article.get_cache_keys() | article._loaded_cache_keys}
+    invalidate_cache(stale_cache_keys)
+    transaction.on_commit(lambda: invalidate_cache(stale_cache_keys))
+    for article in articles:
+        article._loaded_cache_keys = article.get_cache_keys()
+
+def placeholder_names(article):
+    placeholder = copy.copy(article)
+    placeholder.article_id = None
+    placeholder.title = "\0renaming %d" % article.pk
+    return placeholder
+
+# Like bulk_update, but stores compressed texts the way Article.save does.
+# bulk_update writes the attributes as they are, so the text of a compressed
+# article is replaced by an empty string in a copy of the article.
+def bulk_update_articles(articles, fields):
+    stored_articles = []
+    for article in articles:
+        article.update_compressed_text()
+        if article.compressed_text is not None:
+            article = copy.copy(article)
+            article.text = ""
+        stored_articles.append(article)
+    Article.objects.bulk_update(stored_articles, [*fields, "compressed_text"])
+
+# The text of the first article in the queryset, read without building a model
+def get_stored_text(articles):
+    row = articles.values_list("text", "compressed_text").first()
+    if row is None:
+        return None
+    text, compressed_text = row
+    return decompress_text(compressed_text) if compressed_text is not None else text
+
+def invalidate_cache(cache_keys):
+    for key in cache_keys:
+        article_cache.invalidate(key)
+
+# Maps every ID and every title to its article so that a locator can be
+# resolved with a single index probe, whichever of the two names it uses.
+class ArticleName(models.Model):
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["namespace", "name"], name="unique_name"),
+        ]
+
+    namespace = models.CharField(max_length=255)
+    name = models.CharField(max_length=255)
+    article = models.ForeignKey(Article, on_delete=models.CASCADE, related_name="names")
+
+# Every version of an article is recorded as a revision. To save space, most
+# revisions only store the delta to the text of the previous version. Every
+# ARTICLE_REVISION_SNAPSHOT_INTERVAL versions the whole text is stored
+# instead, which bounds the number of deltas needed to restore a text.
+class ArticleRevision(models.Model):
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["article", "version"], name="unique_revision"),
+        ]
+
+    article = models.ForeignKey(Article, on_delete=models.CASCADE, related_name="revisions")
+    version = models.PositiveIntegerField()
+
+    namespace = models.CharField(max_length=255)
+    # The article_id of the article at this version
+    identifier = models.CharField(max_length=255, null=True, blank=True)
+    title = models.CharField(max_length=255)
+    created_at = models.DateTimeField()
+
+    is_snapshot = models.BooleanField()
+    # The compressed text if this is a snapshot, otherwise the compressed delta
+    data = models.BinaryField()
+
+    def get_text(self):
+        snapshot_version = ArticleRevision.objects \
+            .filter(article_id=self.article_id, is_snapshot=True, version__lte=self.version) \
+            .values("article_id") \
+            .annotate(version=Max("version")) \
+            .values("version")
+        chain = ArticleRevision.objects \
+            .filter(article_id=self.article_id, version__lte=self.version, version__gte=Subquery(snapshot_version)) \
+            .order_by("version") \
+            .values_list("is_snapshot", "data")
+
+        text = None
+        for is_snapshot, data in chain:
+            text = decompress_text(data) if is_snapshot else apply_delta(text, decompress_delta(data))
+        return text
+
+    def make_snapshot(self):
+        self.data = compress_text(self.get_text())
+        self.is_snapshot = True
+
+# The revision for the current version of the article. Without the text of the
+# previous version, the revision is a snapshot.
+def make_revision(article, old_text=None):
+    revision = ArticleRevision(
+        article=article,
+        version=article.version,
+        namespace=article.namespace,
+        identifier=article.article_id,
+        title=article.title,
+        created_at=article.last_modified_at,
+        is_snapshot=True)
+
+    if old_text is not None and (article.version - 1) % settings.ARTICLE_REVISION_SNAPSHOT_INTERVAL != 0:
+        delta = make_delta(old_text, article.text)
+        # A rewrite of most of the text is stored more compactly as a snapshot
+        if sum(len(operation) for operation in delta if isinstance(operation, str)) < len(article.text) / 2:
+            revision.data = compress_delta(delta)
+            revision.is_snapshot = False
+            return revision
 
+    revision.data = compress_text(article.text)
+    return revision
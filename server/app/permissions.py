@@ -1,12 +1,59 @@
+from functools import lru_cache
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+LEVELS = ["full", "readonly", "none"]
+
+READABLE_LEVELS = ["full", "readonly"]
+
 def crosscutt_permissions(username, namespace):
+    return get_policy().get_level(username, namespace)
+
+# Namespaces the user may read, derived from the policy alone, so that nobody
+# has to look at the articles to find out
+@lru_cache(maxsize=1024)
+def readable_namespaces(username):
+    policy = get_policy()
+    return tuple(namespace for namespace in policy.namespaces if policy.get_level(username, namespace) in READABLE_LEVELS)
+
+# settings.CROSSCUTT_PERMISSIONS maps every namespace to the permission levels
+# of users, where "*" stands for everybody else, including anonymous users. The
+# rules are compiled into one table keyed by (username, namespace).
+class PermissionPolicy:
+    def __init__(self, rules):
+        self.namespaces = list(rules)
+        self.levels = {}
+        self.default_levels = {}
+
+        for namespace, levels in rules.items():
+            for username, level in levels.items():
+                if level not in LEVELS:
+                    raise ImproperlyConfigured("Unknown permission level " + str(level) + " for namespace " + namespace)
+
+                if username == "*":
+                    self.default_levels[namespace] = level
+                else:
+                    self.levels[(username, namespace)] = level
 
-    if namespace == "paul" and username == "paul":
-        return "full"
+    def get_level(self, username, namespace):
+        level = self.levels.get((username, namespace))
+        if level is None:
+            level = self.default_levels.get(namespace, "none")
+        return level
 
-    if namespace == "paul-ro":
-        return "full" if username == "paul" else "readonly"
+_policy = None
 
-    if namespace == "public":
-        return "full" if username == "paul" else "readonly"
+def get_policy():
+    global _policy
+    if _policy is None:
+        _policy = PermissionPolicy(settings.CROSSCUTT_PERMISSIONS)
+    return _policy
 
-    return "none"
+@receiver(setting_changed)
+def reset_policy(setting, **kwargs):
+    global _policy
+    if setting == "CROSSCUTT_PERMISSIONS":
+        _policy = None
+        readable_namespaces.cache_clear()
@@ -0,0 +1,117 @@
+from django.db import connection, connections
+from .domain.delta import decompress_text
+
+# Title matches weigh more than text matches
+TITLE_WEIGHT = 10.0
+
+class SearchUnavailableException(Exception):
+    pass
+
+def is_search_available():
+    return connection.vendor == "sqlite"
+
+# Ranked hits for the query among the articles in the given namespaces, as
+# (namespace, article_id, title, snippet) tuples. Every word of the query has
+# to occur in the title or text of a hit.
+def search_articles(namespaces, query, limit):
+    if not is_search_available():
+        raise SearchUnavailableException()
+
+    match = build_match_query(query)
+    if match is None or not namespaces:
+        return []
+
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT article.namespace, article.article_id, article.title,
+                snippet(app_article_search, 1, '', '', '...', 24)
+            FROM app_article_search
+            JOIN app_article AS article ON article.id = app_article_search.rowid
+            WHERE app_article_search MATCH %s AND article.namespace IN ({})
+            ORDER BY bm25(app_article_search, {}, 1.0)
+            LIMIT %s
+        """.format(", ".join(["%s"] * len(namespaces)), TITLE_WEIGHT), [match, *namespaces, limit])
+        return cursor.fetchall()
+
+# Quotes every word so that user input never gets interpreted as FTS5 syntax
+def build_match_query(query):
+    words = query.split()
+    if not words:
+        return None
+    return " ".join('"' + word.replace('"', '""') + '"' for word in words)
+
+# The text of an article as stored in the columns text and compressed_text,
+# see ArticleTextDescriptor. Registered with every SQLite connection, since
+# the search index reads the texts through it.
+def article_text(text, compressed_text):
+    return decompress_text(compressed_text) if compressed_text is not None else text
+
+def register_functions(connection, **kwargs):
+    if connection.vendor == "sqlite":
+        connection.connection.create_function("crosscutt_article_text", 2, article_text, deterministic=True)
+
+# The index reads the titles and texts of articles from this view, which
+# decompresses compressed texts. SQLite refuses to rename tables while a view
+# refers to a missing one, which happens whenever a migration rebuilds the
+# article table, so the view is dropped before migrating.
+SEARCH_CONTENT_VIEW = """CREATE VIEW IF NOT EXISTS app_article_search_content AS
+    SELECT id, title, crosscutt_article_text(text, compressed_text) AS text FROM app_article"""
+
+DROP_SEARCH_CONTENT_VIEW = "DROP VIEW IF EXISTS app_article_search_content"
+
+# The same triggers as created by migration 0013, which index the text column
+# as it is. SQLite drops them whenever a migration rebuilds the article table,
+# so they are restored after migrating.
+UNCOMPRESSED_SEARCH_TRIGGERS = [
+    """CREATE TRIGGER IF NOT EXISTS app_article_search_insert AFTER INSERT ON app_article BEGIN
+        INSERT INTO app_article_search(rowid, title, text) VALUES (new.id, new.title, new.text);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS app_article_search_delete AFTER DELETE ON app_article BEGIN
+        INSERT INTO app_article_search(app_article_search, rowid, title, text) VALUES ('delete', old.id, old.title, old.text);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS app_article_search_update AFTER UPDATE OF title, text ON app_article BEGIN
+        INSERT INTO app_article_search(app_article_search, rowid, title, text) VALUES ('delete', old.id, old.title, old.text);
+        INSERT INTO app_article_search(rowid, title, text) VALUES (new.id, new.title, new.text);
+    END""",
+]
+
+# The same triggers as created by migration 0017, which replaces those of 0013
+SEARCH_TRIGGERS = [
+    """CREATE TRIGGER IF NOT EXISTS app_article_search_insert AFTER INSERT ON app_article BEGIN
+        INSERT INTO app_article_search(rowid, title, text)
+            VALUES (new.id, new.title, crosscutt_article_text(new.text, new.compressed_text));
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS app_article_search_delete AFTER DELETE ON app_article BEGIN
+        INSERT INTO app_article_search(app_article_search, rowid, title, text)
+            VALUES ('delete', old.id, old.title, crosscutt_article_text(old.text, old.compressed_text));
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS app_article_search_update AFTER UPDATE OF title, text, compressed_text ON app_article BEGIN
+        INSERT INTO app_article_search(app_article_search, rowid, title, text)
+            VALUES ('delete', old.id, old.title, crosscutt_article_text(old.text, old.compressed_text));
+        INSERT INTO app_article_search(rowid, title, text)
+            VALUES (new.id, new.title, crosscutt_article_text(new.text, new.compressed_text));
+    END""",
+]
+
+def drop_search_content_view(using, **kwargs):
+    database = connections[using]
+    if database.vendor == "sqlite":
+        with database.cursor() as cursor:
+            cursor.execute(DROP_SEARCH_CONTENT_VIEW)
+
+def restore_search_index(using, **kwargs):
+    database = connections[using]
+    if database.vendor != "sqlite" or "app_article_search" not in database.introspection.table_names():
+        return
+
+    # The database may have been migrated back to before 0017, which added the
+    # compressed_text column the view and its triggers read
+    with database.cursor() as cursor:
+        columns = {column.name for column in database.introspection.get_table_description(cursor, "app_article")}
+        if "compressed_text" in columns:
+            cursor.execute(SEARCH_CONTENT_VIEW)
+            statements = SEARCH_TRIGGERS
+        else:
+            statements = UNCOMPRESSED_SEARCH_TRIGGERS
+        for statement in statements:
+            cursor.execute(statement)
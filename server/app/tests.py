@@ -1,3 +1,1158 @@
-from django.test import TestCase
+import asyncio
+import importlib
+import io
+import json
+import gzip
+import multiprocessing
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import timedelta
 
-# Create your tests here.
+from asgiref.sync import SyncToAsync, async_to_sync
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.exceptions import ImproperlyConfigured
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management import call_command
+from django.db import connections, transaction
+from django.test import AsyncClient, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import async_views, tiddlers, views
+from .benchmark import (
+    run_benchmarks, run_compression_benchmarks, run_concurrency_benchmarks, run_object_benchmarks, run_scaling_benchmarks,
+    run_wire_format_benchmarks)
+from .cache import LruCache, article_cache, compressed_response_cache
+from .corpus import generate_corpus
+from .metrics import Histogram, metrics
+from .middleware import record_query
+from .domain.article import Article as DomainArticle, ArticleSerializationService
+from .domain.delta import apply_delta, make_delta
+from .domain.locator import Locator
+from .models import Article, ArticleRevision, VersionConflictException
+from .permissions import PermissionPolicy, crosscutt_permissions, readable_namespaces
+
+
+class PreviewsTest(TestCase):
+    def setUp(self):
+        Article.objects.create(namespace="public", article_id="a", title="A", text="x" * 300)
+        Article.objects.create(namespace="paul", article_id="b", title="B", text="secret")
+
+    def test_anonymous_only_sees_readable_namespaces(self):
+        previews = self.client.get(reverse("previews")).json()["previews"]
+
+        self.assertEqual(previews, [
+            { "namespace": "public", "id": "a", "title": "A", "preview": "x" * 200 },
+        ])
+
+    def test_preview_strips_markdown_and_cuts_at_words(self):
+        Article.objects.create(namespace="public", title="C", text="# Heading\n\nA [[link|https://example.org]] to $G$." + " word" * 100)
+        preview = self.client.get(reverse("previews"), { "after": "public/B" }).json()["previews"][0]["preview"]
+
+        self.assertTrue(preview.startswith("Heading A link to G. word"))
+        self.assertTrue(preview.endswith(" word"))
+        self.assertLessEqual(len(preview), 200)
+
+    def test_update_previews_command(self):
+        Article.objects.update(preview="")
+        output = io.StringIO()
+        call_command("update-previews", batch_size=1, stdout=output)
+
+        self.assertEqual(Article.objects.get(title="A").preview, "x" * 200)
+        self.assertEqual(Article.objects.get(title="B").preview, "secret")
+        self.assertIn("Updated 2 previews", output.getvalue())
+
+    def test_updated_previews_change_the_etag(self):
+        Article.objects.filter(title="A").update(preview="")
+        response = self.client.get(reverse("previews"))
+        call_command("update-previews", stdout=io.StringIO())
+
+        response = self.client.get(reverse("previews"), HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["previews"][0]["preview"], "x" * 200)
+
+    def test_owner_sees_private_namespace(self):
+        self.client.force_login(User.objects.create_user("paul"))
+        previews = self.client.get(reverse("previews")).json()["previews"]
+
+        self.assertEqual(sorted(preview["title"] for preview in previews), ["A", "B"])
+
+
+class PreviewsPaginationTest(TestCase):
+    def setUp(self):
+        for title in ["C", "A", "B"]:
+            Article.objects.create(namespace="public", title=title, text=title.lower())
+
+    def test_pages_follow_next_cursor(self):
+        first = self.client.get(reverse("previews"), { "limit": 2 }).json()
+        self.assertEqual([preview["title"] for preview in first["previews"]], ["A", "B"])
+        self.assertEqual(first["next"], "public/B")
+
+        second = self.client.get(reverse("previews"), { "limit": 2, "after": first["next"] }).json()
+        self.assertEqual([preview["title"] for preview in second["previews"]], ["C"])
+        self.assertIsNone(second["next"])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse("previews"), { "after": "no-slash" }).json()
+        self.assertIn("error", response)
+
+    def test_stream_matches_full_response(self):
+        response = self.client.get(reverse("previews"), { "stream": 1 })
+        streamed = json.loads(b"".join(response.streaming_content))
+
+        self.assertEqual(streamed, self.client.get(reverse("previews")).json())
+
+
+class QueryCountTest(TestCase):
+    def setUp(self):
+        Article.objects.create(namespace="public", article_id="a", title="A", text="a")
+        self.client.force_login(User.objects.create_user("paul"))
+
+    def test_get_previews(self):
+        # session, user, version, previews
+        with self.assertNumQueries(4):
+            self.client.get(reverse("previews"))
+
+    def test_get_article(self):
+        # session, user, article
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse("article"), { "locator": "public/A" }).json()
+        self.assertTrue(response["success"])
+
+    def test_get_missing_article(self):
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse("article"), { "locator": "public/missing" }).json()
+        self.assertEqual(response["reason"], "not found")
+
+    def test_create_article(self):
+        data = json.dumps({ "namespace": "public", "id": "b", "title": "B", "text": "b" })
+        # session, user, savepoint, insert, insert names, insert revision, release savepoint
+        with self.assertNumQueries(7):
+            response = self.client.post(reverse("create-article"), { "data": data }).json()
+        self.assertTrue(response["success"])
+
+    def test_change_article(self):
+        new_data = json.dumps({ "namespace": "public", "id": "a", "title": "A2", "text": "a2" })
+        # session, user, savepoint, article, update, delete names, insert names, insert revision, release savepoint
+        with self.assertNumQueries(9):
+            response = self.client.post(reverse("change-article"), { "locator": "public/A", "new_data": new_data }).json()
+        self.assertTrue(response["success"])
+
+
+class UniquenessTest(TestCase):
+    def setUp(self):
+        Article.objects.create(namespace="public", article_id="a", title="A", text="a")
+        self.client.force_login(User.objects.create_user("paul"))
+
+    def create(self, id, title):
+        data = json.dumps({ "namespace": "public", "id": id, "title": title, "text": "" })
+        return self.client.post(reverse("create-article"), { "data": data }).json()
+
+    def test_rejects_id_equal_to_other_title(self):
+        self.assertFalse(self.create("A", "B")["success"])
+
+    def test_rejects_duplicate_title(self):
+        self.assertFalse(self.create(None, "A")["success"])
+
+    def test_allows_id_equal_to_own_title(self):
+        self.assertTrue(self.create("B", "B")["success"])
+
+    def test_rejects_title_equal_to_other_id(self):
+        self.assertFalse(self.create(None, "a")["success"])
+
+    def test_change_may_keep_own_names(self):
+        new_data = json.dumps({ "namespace": "public", "id": "a", "title": "A", "text": "changed" })
+        response = self.client.post(reverse("change-article"), { "locator": "public/a", "new_data": new_data }).json()
+        self.assertTrue(response["success"])
+        self.assertEqual(Article.objects.get().text, "changed")
+
+
+class VersionTest(TestCase):
+    def setUp(self):
+        Article.objects.create(namespace="public", article_id="a", title="A", text="a")
+        self.client.force_login(User.objects.create_user("paul"))
+
+    def change(self, text, **params):
+        new_data = json.dumps({ "namespace": "public", "id": "a", "title": "A", "text": text })
+        return self.client.post(reverse("change-article"), dict(params, locator="public/a", new_data=new_data)).json()
+
+    def test_change_increments_version(self):
+        self.assertEqual(self.client.get(reverse("article"), { "locator": "public/a" }).json()["version"], 1)
+        self.assertEqual(self.change("b", version=1)["version"], 2)
+        self.assertEqual(self.client.get(reverse("article"), { "locator": "public/a" }).json()["version"], 2)
+
+    def test_rejects_stale_version(self):
+        self.change("b", version=1)
+
+        response = self.change("c", version=1)
+        self.assertEqual(response["reason"], "conflict")
+        self.assertEqual(Article.objects.get().text, "b")
+
+    def test_change_without_version_overwrites(self):
+        self.change("b")
+        self.assertTrue(self.change("c")["success"])
+        self.assertEqual(Article.objects.get().version, 3)
+
+    def test_concurrent_save_conflicts(self):
+        first = Article.objects.get()
+        second = Article.objects.get()
+        first.save()
+
+        with self.assertRaises(VersionConflictException):
+            second.save()
+        self.assertEqual(second.version, 1)
+
+
+@override_settings(ARTICLE_REVISION_SNAPSHOT_INTERVAL=3)
+class RevisionTest(TestCase):
+    def setUp(self):
+        self.article = Article.objects.create(namespace="public", article_id="a", title="A", text="line 1\nline 2\n")
+        self.texts = [self.article.text]
+        for i in range(5):
+            self.article.text += "line %d\n" % (i + 3)
+            self.article.save()
+            self.texts.append(self.article.text)
+
+    def get_revision(self, version, **params):
+        return self.client.get(reverse("revision"), dict(params, locator="public/a", version=version)).json()
+
+    def test_delta_round_trip(self):
+        old = "a\nb\nc\nd"
+        new = "a\nB\nc\nd\ne\n"
+        self.assertEqual(apply_delta(old, make_delta(old, new)), new)
+        self.assertEqual(apply_delta(new, make_delta(new, "")), "")
+
+    def test_stores_deltas_between_snapshots(self):
+        snapshots = ArticleRevision.objects.filter(is_snapshot=True).values_list("version", flat=True)
+        self.assertEqual(sorted(snapshots), [1, 4])
+
+    def test_restores_every_version(self):
+        for version, text in enumerate(self.texts, 1):
+            response = self.get_revision(version, format="2")
+            self.assertEqual(response["version"], version)
+            self.assertEqual(response["article"]["data"]["text"], text)
+
+    def test_lists_revisions(self):
+        self.article.title = "B"
+        self.article.save()
+
+        response = self.client.get(reverse("revisions"), { "locator": "public/a", "limit": 2 }).json()
+        self.assertEqual([revision["version"] for revision in response["revisions"]], [7, 6])
+        self.assertEqual([revision["title"] for revision in response["revisions"]], ["B", "A"])
+        self.assertFalse(response["complete"])
+
+    def test_rejects_invalid_limits(self):
+        for limit in ["-3", "0", "x"]:
+            response = self.client.get(reverse("revisions"), { "locator": "public/a", "limit": limit }).json()
+            self.assertEqual(response["error"], "invalid version or limit")
+
+    def test_hides_revisions_from_unreadable_namespaces(self):
+        article = Article.objects.create(namespace="paul", title="Moved", text="secret")
+        article.namespace = "public"
+        article.text = "published"
+        article.save()
+
+        response = self.client.get(reverse("revisions"), { "locator": "public/Moved" }).json()
+        self.assertEqual([revision["version"] for revision in response["revisions"]], [2])
+        self.assertEqual(self.client.get(reverse("revision"), { "locator": "public/Moved", "version": 1 }).json()["reason"], "forbidden")
+        self.assertEqual(self.client.get(reverse("revision"), { "locator": "public/Moved", "version": 2, "format": "2" })
+            .json()["article"]["data"]["text"], "published")
+
+        self.client.force_login(User.objects.create_user("paul"))
+        response = self.client.get(reverse("revision"), { "locator": "public/Moved", "version": 1, "format": "2" }).json()
+        self.assertEqual(response["article"]["data"]["text"], "secret")
+
+    def test_prune_keeps_latest_revisions(self):
+        output = io.StringIO()
+        call_command("prune-revisions", keep=2, stdout=output)
+
+        self.assertIn("Deleted 4 revisions", output.getvalue())
+        self.assertEqual(sorted(ArticleRevision.objects.values_list("version", flat=True)), [5, 6])
+        self.assertEqual(self.get_revision(5, format="2")["article"]["data"]["text"], self.texts[4])
+        self.assertEqual(self.get_revision(2)["reason"], "not found")
+
+
+@override_settings(ARTICLE_TEXT_COMPRESSION_THRESHOLD=100)
+class TextCompressionTest(TestCase):
+    long_text = "The quick brown fox jumps over the lazy dog.\n" * 20
+
+    def stored(self):
+        return Article.objects.values_list("text", "compressed_text").order_by("pk").first()
+
+    def test_compresses_long_texts(self):
+        Article.objects.create(namespace="public", title="Long", text=self.long_text)
+
+        text, compressed_text = self.stored()
+        self.assertEqual(text, "")
+        self.assertLess(len(compressed_text), len(self.long_text))
+        self.assertEqual(Article.objects.get().text, self.long_text)
+
+    def test_keeps_short_texts(self):
+        Article.objects.create(namespace="public", title="Short", text="short")
+        self.assertEqual(self.stored(), ("short", None))
+
+    def test_decompresses_lazily(self):
+        Article.objects.create(namespace="public", title="Long", text=self.long_text)
+
+        article = Article.objects.get()
+        self.assertNotIn("text", article.__dict__)
+        with self.assertNumQueries(0):
+            self.assertEqual(article.text, self.long_text)
+        self.assertEqual(Article.objects.only("title").get().text, self.long_text)
+
+    def test_search_finds_compressed_texts(self):
+        Article.objects.create(namespace="public", title="Long", text=self.long_text)
+        article = Article.objects.create(namespace="public", title="Other", text=self.long_text)
+        article.text = "short"
+        article.save()
+
+        hits = self.client.get(reverse("search"), { "query": "lazy dog" }).json()["hits"]
+        self.assertEqual([hit["title"] for hit in hits], ["Long"])
+
+    def test_converts_stored_texts(self):
+        with override_settings(ARTICLE_TEXT_COMPRESSION_THRESHOLD=None):
+            Article.objects.create(namespace="public", title="Long", text=self.long_text)
+            Article.objects.create(namespace="public", title="Long 2", text=self.long_text)
+
+        output = io.StringIO()
+        call_command("compress-texts", batch_size=1, stdout=output)
+        self.assertIn("Converted 2 texts", output.getvalue())
+        self.assertEqual(self.stored()[0], "")
+
+        with override_settings(ARTICLE_TEXT_COMPRESSION_THRESHOLD=None):
+            call_command("compress-texts", stdout=io.StringIO())
+        self.assertEqual(self.stored(), (self.long_text, None))
+
+
+class WriteArticlesTest(TestCase):
+    def setUp(self):
+        Article.objects.create(namespace="public", article_id="a", title="A", text="a")
+        Article.objects.create(namespace="public", article_id="b", title="B", text="b")
+        self.client.force_login(User.objects.create_user("paul"))
+
+    def write(self, operations):
+        return self.client.post(reverse("write-articles"), { "operations": json.dumps(operations) }).json()
+
+    def data(self, id, title, text="", namespace="public"):
+        return { "namespace": namespace, "id": id, "title": title, "text": text }
+
+    def test_applies_all_operations(self):
+        response = self.write([
+            { "create": self.data(None, "C", "c") },
+            { "change": "public/a", "new_data": self.data("a", "A2", "changed"), "version": 1 },
+        ])
+
+        self.assertTrue(response["success"])
+        self.assertEqual(response["results"], [
+            { "success": True, "locator": "public/C", "version": 1 },
+            { "success": True, "locator": "public/A2", "version": 2 },
+        ])
+        self.assertEqual(Article.objects.get(title="A2").text, "changed")
+        self.assertTrue(self.client.get(reverse("article"), { "locator": "public/C" }).json()["success"])
+        self.assertFalse(self.client.get(reverse("article"), { "locator": "public/A" }).json()["success"])
+        self.assertEqual(ArticleRevision.objects.filter(article__title="A2").count(), 2)
+
+    def test_applies_nothing_if_one_operation_fails(self):
+        response = self.write([
+            { "create": self.data(None, "C") },
+            { "create": self.data(None, "b") },
+            { "change": "public/missing", "new_data": self.data(None, "D") },
+            { "change": "public/a", "new_data": self.data("a", "A"), "version": 5 },
+            { "create": self.data(None, "X", namespace="paul-private") },
+        ])
+
+        self.assertFalse(response["success"])
+        self.assertEqual([result.get("reason") for result in response["results"]], [
+            "not applied", "ID or title are already taken.", "not found", "conflict", "forbidden",
+        ])
+        self.assertEqual(Article.objects.count(), 2)
+
+    def test_rejects_fields_of_the_wrong_type(self):
+        response = self.write([
+            { "create": self.data(None, "C", namespace=["public"]) },
+            { "create": self.data(1, "D") },
+            { "change": ["public/a"], "new_data": self.data("a", "A") },
+            { "change": "public/a", "new_data": self.data("a", "A"), "version": True },
+            ["create"],
+        ])
+
+        self.assertEqual([result.get("reason") for result in response["results"]], [
+            "invalid data", "invalid data", "invalid operation", "invalid version", "invalid operation",
+        ])
+
+    def test_changed_articles_swap_names(self):
+        response = self.write([
+            { "change": "public/a", "new_data": self.data("b", "B", "a") },
+            { "change": "public/b", "new_data": self.data("a", "A", "b") },
+        ])
+
+        self.assertTrue(response["success"])
+        self.assertEqual(dict(Article.objects.values_list("title", "text")), { "A": "b", "B": "a" })
+        self.assertEqual(Article.objects.get(article_id="a").title, "A")
+        self.assertEqual(self.client.get(reverse("article"), { "locator": "public/a", "format": "2" })
+            .json()["article"]["data"]["text"], "b")
+
+    def test_names_given_up_in_the_batch_are_free(self):
+        response = self.write([
+            { "create": self.data(None, "A") },
+            { "change": "public/A", "new_data": self.data(None, "A2") },
+        ])
+
+        self.assertTrue(response["success"])
+        self.assertEqual(sorted(Article.objects.values_list("title", flat=True)), ["A", "A2", "B"])
+
+    def test_rejects_names_claimed_twice(self):
+        response = self.write([{ "create": self.data(None, "C") }, { "create": self.data("C", "D") }])
+        self.assertEqual([result["reason"] for result in response["results"]], ["ID or title are already taken."] * 2)
+
+    def test_queries_do_not_grow_with_the_batch(self):
+        operations = [{ "create": self.data(None, "New %d" % i, "text") } for i in range(50)]
+        operations += [
+            { "change": "public/" + name, "new_data": self.data(name.lower(), name, "changed") }
+            for name in ["A", "B"]
+        ]
+        # session, user, savepoint, names of changed articles, changed articles, names, update,
+        # insert revisions, insert articles, primary keys of articles, insert names, insert revisions,
+        # release savepoint
+        with self.assertNumQueries(13):
+            self.assertTrue(self.write(operations)["success"])
+        self.assertEqual(Article.objects.count(), 52)
+
+
+class LocatorTest(TestCase):
+    def setUp(self):
+        Article.objects.create(namespace="public", article_id="a", title="A", text="a")
+
+    def get(self, locator):
+        return self.client.get(reverse("article"), { "locator": locator }).json()
+
+    def test_resolves_id_and_title(self):
+        self.assertTrue(self.get("public/a")["success"])
+        self.assertTrue(self.get("public/A")["success"])
+
+    def test_names_follow_changes(self):
+        article = Article.objects.get()
+        article.title = "B"
+        article.save()
+
+        self.assertFalse(self.get("public/A")["success"])
+        self.assertTrue(self.get("public/B")["success"])
+
+
+class LruCacheTest(SimpleTestCase):
+    def test_evicts_least_recently_used_entry(self):
+        cache = LruCache(max_entries=2, max_bytes=100)
+        cache.set("a", "1")
+        cache.set("b", "2")
+        cache.get("a")
+        cache.set("c", "3")
+
+        self.assertEqual(cache.get("a"), "1")
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get_stats(), { "hits": 2, "misses": 1, "evictions": 1, "entries": 2, "bytes": 2 })
+
+    def test_evicts_by_size(self):
+        cache = LruCache(max_entries=10, max_bytes=5)
+        cache.set("a", "123")
+        cache.set("b", "456")
+
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get("b"), "456")
+
+    def test_skips_values_read_before_an_invalidation(self):
+        cache = LruCache(max_entries=10, max_bytes=100)
+        generation = cache.get_generation()
+        cache.invalidate("a")
+        cache.set("a", "stale", generation=generation)
+
+        self.assertIsNone(cache.get("a"))
+        cache.set("a", "fresh", generation=cache.get_generation())
+        self.assertEqual(cache.get("a"), "fresh")
+
+    def test_expires_old_entries(self):
+        cache = LruCache(max_entries=10, max_bytes=100, max_age=60)
+        cache.set("a", "1")
+        self.assertEqual(cache.get("a"), "1")
+
+        cache.max_age = 0
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get_stats()["entries"], 0)
+
+
+class ArticleCacheTest(TestCase):
+    def setUp(self):
+        Article.objects.create(namespace="public", article_id="a", title="A", text="old")
+
+    def get(self, locator):
+        return self.client.get(reverse("article"), { "locator": locator }).json()
+
+    def test_hit_does_not_query(self):
+        self.get("public/a")
+        with self.assertNumQueries(0):
+            self.assertTrue(self.get("public/A")["success"])
+
+    def test_change_invalidates_old_and_new_names(self):
+        self.get("public/A")
+        self.get("public/B")
+
+        article = Article.objects.get()
+        article.title = "B"
+        article.text = "new"
+        article.save()
+
+        self.assertFalse(self.get("public/A")["success"])
+        self.assertIn("new", self.get("public/B")["article"])
+
+    def test_read_racing_a_write_is_not_cached(self):
+        article = Article.objects.get()
+        generation = article_cache.get_generation()
+        article.text = "new"
+        article.save()
+        views.serialize_article_data(Article.objects.get(), generation)
+
+        self.assertIsNone(article_cache.get(("public", "a")))
+
+
+class ConditionalRequestTest(TestCase):
+    def setUp(self):
+        Article.objects.create(namespace="public", article_id="a", title="A", text="a")
+
+    def test_article_not_modified(self):
+        response = self.client.get(reverse("article"), { "locator": "public/a" })
+        article_cache.clear()
+
+        with self.assertNumQueries(1):
+            not_modified = self.client.get(reverse("article"), { "locator": "public/a" }, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(not_modified.status_code, 304)
+
+        not_modified = self.client.get(reverse("article"), { "locator": "public/a" }, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_article_modified(self):
+        response = self.client.get(reverse("article"), { "locator": "public/a" })
+
+        article = Article.objects.get()
+        article.text = "b"
+        article.last_modified_at += timedelta(seconds=1)
+        article.save()
+
+        modified = self.client.get(reverse("article"), { "locator": "public/a" }, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(modified.status_code, 200)
+
+    def test_previews_not_modified(self):
+        response = self.client.get(reverse("previews"))
+
+        not_modified = self.client.get(reverse("previews"), HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(not_modified.status_code, 304)
+
+        Article.objects.create(namespace="public", title="B", text="b")
+        modified = self.client.get(reverse("previews"), HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(modified.status_code, 200)
+
+    def test_previews_etag_ignores_other_parameters(self):
+        response = self.client.get(reverse("previews"))
+
+        self.assertEqual(self.client.get(reverse("previews"), { "cache-buster": "1" })["ETag"], response["ETag"])
+        self.assertNotEqual(self.client.get(reverse("previews"), { "limit": "1" })["ETag"], response["ETag"])
+
+
+class ChangesTest(TestCase):
+    def setUp(self):
+        self.old = Article.objects.create(namespace="public", title="Old", text="")
+        self.since = timezone.now()
+        Article.objects.create(namespace="public", title="New", text="")
+        Article.objects.create(namespace="paul", title="Private", text="")
+
+    def get(self, since, **params):
+        return self.client.get(reverse("changes"), dict(params, since=since.isoformat())).json()
+
+    def test_returns_readable_articles_modified_since(self):
+        changes = self.get(self.since)
+        self.assertEqual([change["title"] for change in changes["changes"]], ["New"])
+        self.assertTrue(changes["complete"])
+
+    def test_saving_bumps_last_modified_at(self):
+        self.old.text = "changed"
+        self.old.save()
+
+        self.assertEqual([change["title"] for change in self.get(self.since)["changes"]], ["New", "Old"])
+
+    def test_pages_continue_until_complete(self):
+        first = self.get(self.since - timedelta(days=1), limit=1)
+        self.assertFalse(first["complete"])
+
+        second = self.client.get(reverse("changes"), { "since": first["until"], "limit": 1 }).json()
+        self.assertEqual([change["title"] for change in second["changes"]], ["New"])
+        self.assertTrue(second["complete"])
+
+    def test_pages_through_articles_changed_at_once(self):
+        operations = [{ "change": "public/" + title, "new_data": { "namespace": "public", "id": None, "title": title, "text": "x" } }
+            for title in ["Old", "New", "Third"]]
+        Article.objects.create(namespace="public", title="Third", text="")
+        self.client.force_login(User.objects.create_user("paul"))
+        self.assertTrue(self.client.post(reverse("write-articles"), { "operations": json.dumps(operations) }).json()["success"])
+
+        titles = []
+        changes = self.get(self.since, limit=1)
+        while True:
+            titles += [change["title"] for change in changes["changes"] if change["namespace"] == "public"]
+            if changes["complete"]:
+                break
+            changes = self.client.get(reverse("changes"), { "since": changes["until"], "limit": 1 }).json()
+        self.assertEqual(titles, ["Old", "New", "Third"])
+
+    def test_includes_new_articles_with_old_modification_times(self):
+        Article.objects.create(namespace="public", title="Imported", text="", last_modified_at=self.since - timedelta(days=365))
+
+        self.assertEqual([change["title"] for change in self.get(self.since)["changes"]], ["New", "Imported"])
+
+
+class TiddlyWikiImportTest(TestCase):
+    tiddlers = [
+        { "title": "A", "text": "a", "created": "20200101120000000", "modified": "20200102120000000" },
+        { "title": "B", "text": "b \"quoted\" ]", "created": "20200101120000000", "modified": "20200102120000000" },
+    ]
+
+    def write_tiddlers(self, tiddlers):
+        file = tempfile.NamedTemporaryFile("w", suffix=".json", delete=False)
+        with file:
+            json.dump(tiddlers, file, indent=2)
+        self.addCleanup(os.remove, file.name)
+        return file.name
+
+    def test_streams_tiddlers_across_chunks(self):
+        command = importlib.import_module("app.management.commands.tiddlywiki-import")
+        filename = self.write_tiddlers(self.tiddlers)
+
+        self.assertEqual(list(command.import_tiddlers(filename, chunk_size=7)), self.tiddlers)
+
+    def test_imports_in_batches(self):
+        output = io.StringIO()
+        call_command("tiddlywiki-import", self.write_tiddlers(self.tiddlers), batch_size=1, stdout=output)
+
+        self.assertEqual(sorted(Article.objects.values_list("title", flat=True)), ["A", "B"])
+        self.assertIn("2 created, 0 updated, 0 skipped", output.getvalue())
+        self.assertTrue(self.client.get(reverse("article"), { "locator": "public/B" }).json()["success"])
+
+    def test_imports_with_workers(self):
+        tiddlers = [dict(self.tiddlers[0], title=str(i)) for i in range(20)]
+        output = io.StringIO()
+        call_command("tiddlywiki-import", self.write_tiddlers(tiddlers), batch_size=3, workers=2, stdout=output)
+
+        self.assertEqual(Article.objects.count(), 20)
+        self.assertIn("20 created", output.getvalue())
+
+    def test_prepares_batches_in_spawned_workers(self):
+        with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn"), initializer=tiddlers.setup_worker) as pool:
+            articles = pool.submit(tiddlers.prepare_batch, self.tiddlers).result()
+
+        self.assertEqual([article.title for article in articles], ["A", "B"])
+
+    def test_skips_or_updates_taken_titles(self):
+        Article.objects.create(namespace="public", title="A", text="old")
+        Article.objects.create(namespace="public", article_id="B", title="Other", text="other")
+        filename = self.write_tiddlers(self.tiddlers)
+
+        output = io.StringIO()
+        call_command("tiddlywiki-import", filename, stdout=output)
+        self.assertIn("0 created, 0 updated, 2 skipped", output.getvalue())
+
+        output = io.StringIO()
+        call_command("tiddlywiki-import", filename, upsert=True, stdout=output)
+        self.assertIn("0 created, 1 updated, 1 skipped", output.getvalue())
+        self.assertEqual(Article.objects.get(title="A").text, "a")
+        self.assertEqual(Article.objects.get(title="A").version, 2)
+
+    def test_updates_invalidate_previews_and_appear_as_changes(self):
+        Article.objects.create(namespace="public", title="A", text="old")
+        Article.objects.create(namespace="public", title="Z", text="modified last")
+        etag = self.client.get(reverse("previews"))["ETag"]
+        since = timezone.now()
+
+        call_command("tiddlywiki-import", self.write_tiddlers(self.tiddlers[:1]), upsert=True, stdout=io.StringIO())
+
+        self.assertEqual(self.client.get(reverse("previews"), HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        changes = self.client.get(reverse("changes"), { "since": since.isoformat() }).json()["changes"]
+        self.assertEqual([change["title"] for change in changes], ["A"])
+
+
+class ArticleSerializationTest(SimpleTestCase):
+    def test_round_trip(self):
+        article = DomainArticle({ "namespace": "public", "id": None, "title": "A", "text": "a", "extra": 1 }, "readonly")
+        deserialized = ArticleSerializationService.deserialize(ArticleSerializationService.serialize(article))
+
+        self.assertEqual(deserialized.getData(), { "namespace": "public", "id": None, "title": "A", "text": "a" })
+        self.assertTrue(deserialized.isReadOnly())
+
+
+class WireFormatTest(TestCase):
+    def setUp(self):
+        Article.objects.create(namespace="public", article_id="a", title="A", text="\"quoted\"\n")
+
+    def test_format_2_nests_article(self):
+        legacy = self.client.get(reverse("article"), { "locator": "public/a" }).json()
+        nested = self.client.get(reverse("article"), { "locator": "public/a" }, HTTP_X_CROSSCUTT_FORMAT="2").json()
+
+        article = json.loads(legacy["article"])
+        self.assertEqual(nested["article"], { "data": json.loads(article["data"]), "permissions": article["permissions"] })
+        self.assertEqual(nested["article"]["data"]["text"], "\"quoted\"\n")
+
+    def test_formats_have_different_etags(self):
+        legacy = self.client.get(reverse("article"), { "locator": "public/a" })
+        nested = self.client.get(reverse("article"), { "locator": "public/a", "format": "2" })
+
+        self.assertNotEqual(legacy["ETag"], nested["ETag"])
+        self.assertIn("X-Crosscutt-Format", nested["Vary"])
+
+    def test_unknown_formats_are_format_1(self):
+        legacy = self.client.get(reverse("article"), { "locator": "public/a" })
+        unknown = self.client.get(reverse("article"), { "locator": "public/a", "format": "x" * 100 })
+
+        self.assertEqual(unknown["ETag"], legacy["ETag"])
+        self.assertEqual(unknown.content, legacy.content)
+
+
+class ArticlesBatchTest(TestCase):
+    def setUp(self):
+        Article.objects.create(namespace="public", article_id="a", title="A", text="a")
+        Article.objects.create(namespace="public", article_id="b", title="B", text="b")
+        Article.objects.create(namespace="paul", title="Private", text="secret")
+
+    def test_results_match_single_lookups(self):
+        locators = ["public/a", "public/B", "public/missing", "paul/Private", "invalid"]
+
+        with self.assertNumQueries(1):
+            articles = self.client.get(reverse("articles"), { "locator": locators }).json()["articles"]
+
+        self.assertEqual([article["locator"] for article in articles], locators)
+        for locator, article in zip(locators[:-1], articles):
+            del article["locator"]
+            self.assertEqual(article, self.client.get(reverse("article"), { "locator": locator }).json())
+        self.assertEqual(articles[-1]["reason"], "invalid locator")
+
+    def test_uses_cache(self):
+        self.client.get(reverse("article"), { "locator": "public/a" })
+
+        with self.assertNumQueries(0):
+            articles = self.client.get(reverse("articles"), { "locator": ["public/a"], "format": "2" }).json()["articles"]
+        self.assertEqual(articles[0]["article"]["data"]["text"], "a")
+
+    def test_answers_every_repeated_locator(self):
+        locators = ["public/a", "invalid", "public/a", "invalid", "public/A"]
+
+        with self.assertNumQueries(1):
+            articles = self.client.get(reverse("articles"), { "locator": locators }).json()["articles"]
+        self.assertEqual([article["locator"] for article in articles], locators)
+        self.assertEqual([article["success"] for article in articles], [True, False, True, False, True])
+
+
+class SearchTest(TestCase):
+    def setUp(self):
+        Article.objects.create(namespace="public", title="Linear codes", text="A code is a subspace.")
+        Article.objects.create(namespace="public", title="Subspace", text="Linear algebra.")
+        Article.objects.create(namespace="paul", title="Private subspace", text="")
+
+    def search(self, query):
+        return self.client.get(reverse("search"), { "query": query }).json()["hits"]
+
+    def test_ranks_title_matches_first(self):
+        self.assertEqual([hit["title"] for hit in self.search("subspace")], ["Subspace", "Linear codes"])
+
+    def test_follows_changes(self):
+        article = Article.objects.get(title="Subspace")
+        article.text = "Vector spaces."
+        article.save()
+
+        self.assertEqual([hit["title"] for hit in self.search("vector")], ["Subspace"])
+        self.assertEqual(self.search("algebra"), [])
+
+    def test_rejects_invalid_limits(self):
+        for limit in ["-1", "0", "x"]:
+            response = self.client.get(reverse("search"), { "query": "subspace", "limit": limit }).json()
+            self.assertEqual(response["error"], "invalid limit")
+
+    def test_ignores_query_syntax(self):
+        self.assertEqual(self.search('"linear OR'), [])
+        self.assertEqual(self.search(""), [])
+
+
+class SearchMigrationTest(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+
+        connections.databases["migrations"] = dict(settings.DATABASES["default"], NAME=os.path.join(directory.name, "migrations.sqlite3"))
+        self.addCleanup(connections.databases.pop, "migrations")
+        self.addCleanup(connections["migrations"].close)
+
+    def migrate(self, migration):
+        call_command("migrate", "app", migration, database="migrations", verbosity=0)
+
+    def get_schema(self):
+        with connections["migrations"].cursor() as cursor:
+            cursor.execute("SELECT name, sql FROM sqlite_master WHERE name LIKE 'app_article_search_%'")
+            return dict(cursor.fetchall())
+
+    def test_restores_the_index_of_the_applied_migration(self):
+        self.migrate("0016")
+        schema = self.get_schema()
+        self.assertNotIn("app_article_search_content", schema)
+        self.assertIn("VALUES (new.id, new.title, new.text)", schema["app_article_search_insert"])
+
+        self.migrate("0018")
+        schema = self.get_schema()
+        self.assertIn("app_article_search_content", schema)
+        self.assertIn("crosscutt_article_text(new.text, new.compressed_text)", schema["app_article_search_insert"])
+
+        self.migrate("0013")
+        self.assertIn("VALUES (new.id, new.title, new.text)", self.get_schema()["app_article_search_update"])
+
+
+class PermissionPolicyTest(SimpleTestCase):
+    def test_matches_users_before_everybody_else(self):
+        self.assertEqual(crosscutt_permissions("paul", "public"), "full")
+        self.assertEqual(crosscutt_permissions("someone", "public"), "readonly")
+        self.assertEqual(crosscutt_permissions(None, "paul"), "none")
+        self.assertEqual(crosscutt_permissions("paul", "unknown"), "none")
+
+    def test_readable_namespaces(self):
+        self.assertEqual(set(readable_namespaces(None)), { "paul-ro", "public" })
+        self.assertEqual(set(readable_namespaces("paul")), { "paul", "paul-ro", "public" })
+
+    @override_settings(CROSSCUTT_PERMISSIONS={ "drafts": { "anna": "full" } })
+    def test_policy_follows_settings(self):
+        self.assertEqual(crosscutt_permissions("anna", "drafts"), "full")
+        self.assertEqual(readable_namespaces("anna"), ("drafts",))
+
+    def test_rejects_unknown_levels(self):
+        with self.assertRaises(ImproperlyConfigured):
+            PermissionPolicy({ "public": { "*": "write" } })
+
+
+class AsyncViewsTest(TestCase):
+    def setUp(self):
+        Article.objects.create(namespace="public", article_id="a", title="A", text="a")
+        self.factory = RequestFactory()
+
+    def request(self, url, params):
+        request = self.factory.get(reverse(url), params)
+        request.user = AnonymousUser()
+        return request
+
+    def get(self, async_view, url, params):
+        return async_to_sync(async_view)(self.request(url, params))
+
+    def assertSameResponse(self, url, params, async_view, view):
+        self.assertEqual(self.get(async_view, url, params).content, view(self.request(url, params)).content)
+
+    def test_matches_sync_views(self):
+        self.assertSameResponse("article", { "locator": "public/a" }, async_views.get_article, views.get_article)
+        self.assertSameResponse("articles", { "locator": ["public/a", "public/b"] }, async_views.get_articles, views.get_articles)
+        self.assertSameResponse("previews", {}, async_views.get_previews, views.get_previews)
+        self.assertSameResponse("search", { "query": "a" }, async_views.get_search, views.get_search)
+
+    def test_streams_previews(self):
+        response = self.get(async_views.get_previews, "previews", { "stream": 1 })
+        self.assertEqual(json.loads(b"".join(response.streaming_content))["previews"][0]["title"], "A")
+
+
+class SQLiteStressTest(SimpleTestCase):
+    writers = 4
+    readers = 4
+    increments = 25
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+
+        connections.databases["stress"] = dict(settings.DATABASES["default"], NAME=os.path.join(directory.name, "stress.sqlite3"))
+        self.addCleanup(connections.databases.pop, "stress")
+        with connections["stress"].cursor() as cursor:
+            cursor.execute("CREATE TABLE counter (value INTEGER)")
+            cursor.execute("INSERT INTO counter VALUES (0)")
+        connections["stress"].close()
+
+    def increment(self):
+        for _ in range(self.increments):
+            with transaction.atomic(using="stress"), connections["stress"].cursor() as cursor:
+                cursor.execute("SELECT value FROM counter")
+                value = cursor.fetchone()[0]
+                cursor.execute("UPDATE counter SET value = %s", [value + 1])
+
+    def read(self):
+        for _ in range(self.increments):
+            with connections["stress"].cursor() as cursor:
+                cursor.execute("SELECT value FROM counter")
+
+    def run_and_close(self, work):
+        try:
+            work()
+        finally:
+            connections["stress"].close()
+
+    def test_concurrent_read_modify_write(self):
+        with ThreadPoolExecutor(self.writers + self.readers) as pool:
+            futures = [pool.submit(self.run_and_close, self.increment) for _ in range(self.writers)]
+            futures += [pool.submit(self.run_and_close, self.read) for _ in range(self.readers)]
+            for future in futures:
+                future.result()
+
+        with connections["stress"].cursor() as cursor:
+            cursor.execute("PRAGMA journal_mode")
+            self.assertEqual(cursor.fetchone()[0], "wal")
+            cursor.execute("SELECT value FROM counter")
+            self.assertEqual(cursor.fetchone()[0], self.writers * self.increments)
+        connections["stress"].close()
+
+
+@override_settings(CROSSCUTT_METRICS_TOKEN="token")
+class MetricsTest(TestCase):
+    def setUp(self):
+        metrics.clear()
+        Article.objects.create(namespace="public", article_id="a", title="A", text="a")
+
+    def get_metrics(self):
+        return self.client.get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer token").content.decode()
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = Histogram((1, 2))
+        for value in [0.5, 1, 1.5, 3]:
+            histogram.observe(value)
+        self.assertEqual(list(histogram.get_buckets()), [("1", 2), ("2", 3), ("+Inf", 4)])
+
+    def test_records_requests_by_url_name(self):
+        response = self.client.get(reverse("article"), { "locator": "public/a" })
+        self.client.get(reverse("article"), { "locator": "public/a" })
+
+        text = self.get_metrics()
+        self.assertIn('crosscutt_request_duration_seconds_count{view="article"} 2', text)
+        self.assertIn('crosscutt_db_queries_total{view="article"} 1', text)
+        self.assertIn('crosscutt_response_bytes_total{view="article"} %d' % (2 * len(response.content)), text)
+        self.assertIn("crosscutt_article_cache_hits_total ", text)
+        self.assertIn('crosscutt_section_duration_seconds_count{section="serialize_article"} 1', text)
+
+    def test_counts_streamed_bytes(self):
+        response = self.client.get(reverse("previews"), { "stream": "" })
+        content = b"".join(response.streaming_content)
+
+        self.assertIn('crosscutt_response_bytes_total{view="previews"} %d' % len(content), self.get_metrics())
+
+    def test_only_served_with_the_token(self):
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 404)
+        self.assertEqual(self.client.get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer other").status_code, 404)
+        with override_settings(CROSSCUTT_METRICS_TOKEN=None):
+            self.assertEqual(self.client.get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer None").status_code, 404)
+
+    def test_records_async_requests(self):
+        async def get():
+            return await AsyncClient().get(reverse("article") + "?locator=public/a")
+        async_to_sync(get)()
+
+        self.assertIn('crosscutt_request_duration_seconds_count{view="article"} 1', self.get_metrics())
+        self.assertIn('crosscutt_db_queries_total{view="article"} 1', self.get_metrics())
+
+    def test_records_queries_of_every_connection(self):
+        self.assertIn(record_query, connections["default"].execute_wrappers)
+
+    def test_stays_async_under_asgi(self):
+        handler = ASGIHandler()
+
+        self.assertTrue(asyncio.iscoroutinefunction(handler._middleware_chain))
+        self.assertNotIsInstance(handler._middleware_chain, SyncToAsync)
+
+    @override_settings(CROSSCUTT_SLOW_QUERY_SECONDS=0)
+    def test_logs_slow_queries(self):
+        with self.assertLogs("app.middleware", "WARNING") as logs:
+            self.client.get(reverse("article"), { "locator": "public/a" })
+        self.assertIn("Slow query", logs.output[0])
+
+    @override_settings(CROSSCUTT_PROFILE_URL_NAMES=["article"], CROSSCUTT_PROFILE_SAMPLE_RATE=1)
+    def test_profiles_chosen_requests(self):
+        with self.assertLogs("app.middleware", "INFO") as logs:
+            self.client.get(reverse("article"), { "locator": "public/a" })
+        self.assertIn("Profile of GET", logs.output[0])
+
+
+class CorpusTest(TestCase):
+    def test_generates_the_same_corpus_for_a_seed(self):
+        generate_corpus(20, ["public", "paul"], seed=1)
+        articles = list(Article.objects.order_by("pk").values_list("namespace", "article_id", "title", "text"))
+        Article.objects.all().delete()
+        generate_corpus(20, ["public", "paul"], seed=1)
+
+        self.assertEqual(list(Article.objects.order_by("pk").values_list("namespace", "article_id", "title", "text")), articles)
+        self.assertEqual(Article.objects.filter(namespace="paul").count(), 10)
+
+    def test_benchmark_reports_every_scenario(self):
+        results = run_benchmarks(20, ["public", "paul"], requests=3, warmup=1)
+
+        self.assertEqual(results["parameters"]["articles"], 20)
+        for scenario in ["get_previews", "get_article_cached", "create_article", "change_article"]:
+            self.assertEqual(results["scenarios"][scenario]["requests"], 3)
+            self.assertLessEqual(results["scenarios"][scenario]["p50_ms"], results["scenarios"][scenario]["p99_ms"])
+        self.assertEqual(results["scenarios"]["get_article_uncached"]["max_queries"], 3)
+
+    def test_scaling_benchmark_grows_the_corpus(self):
+        results = run_scaling_benchmarks([20, 10], ["public", "paul"], requests=2, warmup=0)
+
+        self.assertEqual(list(results["sizes"]), ["10", "20"])
+        self.assertEqual(Article.objects.count(), 20)
+        self.assertGreater(results["sizes"]["20"]["get_previews_stream"]["peak_memory_bytes"], 0)
+        self.assertEqual(results["sizes"]["20"]["resolve_locator"]["max_queries"], 1)
+        self.assertEqual(results["sizes"]["20"]["search_two_words"]["requests"], 2)
+
+    def test_wire_format_benchmark_serves_both_formats(self):
+        results = run_wire_format_benchmarks(requests=2, warmup=0, sizes={ "small": 100, "large": 10000 })
+
+        self.assertEqual(list(results["sizes"]["large"]["scenarios"]), ["format_1_cached", "format_1_uncached", "format_2_cached", "format_2_uncached"])
+        self.assertLess(results["sizes"]["large"]["response_bytes"]["2"], results["sizes"]["large"]["response_bytes"]["1"])
+
+    def test_slotted_objects_are_smaller(self):
+        objects = run_object_benchmarks(1000)["objects"]
+
+        self.assertLess(objects["locator"]["bytes_per_instance"], objects["locator_with_dict"]["bytes_per_instance"])
+        self.assertLess(objects["article"]["bytes_per_instance"], objects["article_with_dict"]["bytes_per_instance"])
+        self.assertLess(objects["preview"]["bytes_per_instance"], objects["preview_dict"]["bytes_per_instance"])
+
+
+# The concurrent load runs in other threads, which cannot see the data of a
+# TestCase transaction, and VACUUM cannot run inside a transaction at all
+class TransactionBenchmarkTest(TransactionTestCase):
+    def test_benchmarks_sync_and_async_views(self):
+        results = run_concurrency_benchmarks(20, ["public", "paul"], requests=8, concurrency=4, warmup=1)
+
+        for name in ["sync", "async"]:
+            for scenario in ["get_article_cached", "get_previews_page"]:
+                self.assertEqual(results["views"][name][scenario]["requests"], 8)
+
+    def test_compression_shrinks_the_database(self):
+        results = run_compression_benchmarks(50, ["public", "paul"], requests=2, threshold=100, warmup=0)["storage"]
+
+        self.assertLess(results["compressed"]["text_bytes"], results["uncompressed"]["text_bytes"])
+        self.assertLess(results["compressed"]["database_bytes"], results["uncompressed"]["database_bytes"])
+        self.assertGreaterEqual(results["compressed"]["page_cache_hit_rate"], results["uncompressed"]["page_cache_hit_rate"])
+        self.assertEqual(results["compressed"]["scenarios"]["read_text"]["requests"], 2)
+
+
+class ExportStaticTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.article = Article.objects.create(namespace="public", article_id="a", title="A/B", text="a")
+        Article.objects.create(namespace="public", title="C", text="c")
+        Article.objects.create(namespace="paul", title="Private", text="secret")
+
+    def export(self, **options):
+        output = io.StringIO()
+        call_command("export-static", self.directory, page_size=1, stdout=output, **options)
+        return output.getvalue()
+
+    def read(self, *path):
+        with open(os.path.join(self.directory, *path)) as file:
+            return json.load(file)
+
+    def test_files_match_responses(self):
+        self.export()
+
+        self.assertEqual(self.read("public", "articles", "A%2FB.json"), self.client.get(reverse("article"), { "locator": "public/a" }).json())
+        self.assertEqual(self.read("public", "articles", "a.json"), self.read("public", "articles", "A%2FB.json"))
+        self.assertEqual(self.read("public", "previews", "page-0.json")["next_page"], "page-1.json")
+        self.assertEqual(
+            [self.read("public", "previews", "page-%d.json" % i)["previews"][0] for i in range(2)],
+            self.client.get(reverse("previews")).json()["previews"])
+        self.assertFalse(os.path.exists(os.path.join(self.directory, "paul")))
+
+    def test_rewrites_only_changed_articles(self):
+        self.export()
+        self.assertIn("Wrote 0 articles (2 unchanged), 0 preview pages", self.export())
+
+        self.article.title = "D"
+        self.article.save()
+
+        self.assertIn("Wrote 1 articles (1 unchanged), 2 preview pages and removed 1 files", self.export())
+        self.assertFalse(os.path.exists(os.path.join(self.directory, "public", "articles", "A%2FB.json")))
+        self.assertEqual(json.loads(self.read("public", "articles", "D.json")["article"])["data"], json.dumps(
+            { "namespace": "public", "id": "a", "title": "D", "text": "a" }))
+
+    def test_rewrites_everything_in_another_format(self):
+        self.export()
+        self.assertIn("Wrote 2 articles (0 unchanged)", self.export(format="2"))
+        self.assertEqual(self.read("public", "articles", "C.json")["article"]["data"]["text"], "c")
+
+    def test_rewrites_everything_with_other_permissions(self):
+        self.export()
+        with override_settings(CROSSCUTT_PERMISSIONS=dict(settings.CROSSCUTT_PERMISSIONS, public={ "*": "full" })):
+            self.assertIn("Wrote 2 articles (0 unchanged)", self.export())
+        self.assertEqual(json.loads(self.read("public", "articles", "C.json")["article"])["permissions"], "full")
+
+    def test_removes_namespaces_that_are_no_longer_readable(self):
+        self.export(user="paul")
+        self.assertTrue(os.path.exists(os.path.join(self.directory, "paul", "articles", "Private.json")))
+
+        self.export()
+        self.assertFalse(os.path.exists(os.path.join(self.directory, "paul")))
+        self.assertTrue(os.path.exists(os.path.join(self.directory, "public", "articles", "C.json")))
+
+@override_settings(COMPRESSED_RESPONSE_MIN_BYTES=100)
+class CompressionTest(TestCase):
+    def setUp(self):
+        compressed_response_cache.clear()
+        self.article = Article.objects.create(namespace="public", article_id="a", title="A", text="compressible " * 100)
+
+    def get(self, encoding, **params):
+        return self.client.get(reverse("article"), dict(params, locator="public/a"), HTTP_ACCEPT_ENCODING=encoding)
+
+    def test_negotiates_encoding(self):
+        plain = self.get("identity")
+        compressed = self.get("br;q=0, gzip;q=0.5, *;q=0")
+
+        self.assertFalse(plain.has_header("Content-Encoding"))
+        self.assertEqual(compressed["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(compressed.content), plain.content)
+        self.assertIn("Accept-Encoding", compressed["Vary"])
+        self.assertEqual(compressed["ETag"], "W/" + plain["ETag"])
+
+    def test_serves_hot_articles_from_cache(self):
+        first = self.get("gzip")
+        with self.assertNumQueries(0):
+            second = self.get("gzip")
+
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(compressed_response_cache.get_stats()["hits"], 1)
+
+    def test_write_changes_the_cached_version(self):
+        self.get("gzip")
+        self.article.text = "changed " * 100
+        self.article.save()
+
+        content = json.loads(gzip.decompress(self.get("gzip").content))
+        self.assertIn("changed", content["article"])
+
+    def test_compresses_previews(self):
+        for i in range(10):
+            Article.objects.create(namespace="public", title="Article %d" % i, text="text " * 20)
+
+        plain = self.client.get(reverse("previews"))
+        compressed = self.client.get(reverse("previews"), HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(gzip.decompress(compressed.content), plain.content)
+
+    def test_async_view_compresses_outside_the_event_loop(self):
+        self.get("gzip")
+        compressed_response_cache.clear()
+        request = RequestFactory().get(reverse("article"), { "locator": "public/a" }, HTTP_ACCEPT_ENCODING="gzip")
+        request.user = AnonymousUser()
+
+        cached, response = views.cached_article_response_without_compressing(request, Locator("public", "a"), "readonly")
+        self.assertIsNotNone(cached)
+        self.assertIsNone(response)
+
+        response = async_to_sync(async_views.get_article)(request)
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(response.content), self.get("identity").content)
+
+    def test_skips_small_responses(self):
+        with override_settings(COMPRESSED_RESPONSE_MIN_BYTES=100000):
+            self.assertFalse(self.get("gzip").has_header("Content-Encoding"))
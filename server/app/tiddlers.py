@@ -0,0 +1,54 @@
+import os
+from datetime import datetime, timezone
+
+import django
+from django.core.exceptions import ValidationError
+from django.core.management.base import CommandError
+
+# Converting tiddlers into articles, which the tiddlywiki-import command runs
+# in worker processes. Workers started with spawn or forkserver import this
+# module before Django is set up, so models are only imported by the
+# functions, never at the top.
+
+NAMESPACE = "public"
+
+def setup_worker():
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "server.settings")
+    django.setup()
+
+# Converts and validates the tiddlers of a batch without touching the database
+def prepare_batch(tiddlers):
+    from .models import Article
+
+    articles = []
+    for tiddler in tiddlers:
+        if tiddler["title"] == "Robin Hartshorne: Algebraic Geometry":
+            continue
+
+        article = Article(
+            article_id=None,
+            title=tiddler["title"],
+            text=tiddler["text"],
+            namespace=NAMESPACE,
+            created_at=parse_tiddler_date(tiddler["created"]),
+            last_modified_at=parse_tiddler_date(tiddler["modified"]))
+
+        try:
+            article.full_clean(validate_unique=False)
+        except ValidationError as e:
+            raise CommandError("Invalid tiddler " + tiddler["title"] + ": " + str(e))
+
+        articles.append(article)
+
+    return articles
+
+def parse_tiddler_date(string):
+    year = int(string[0:4])
+    month = int(string[4:6])
+    day = int(string[6:8])
+    hour = int(string[8:10])
+    minute = int(string[10:12])
+    second = int(string[12:14])
+    millisecond = int(string[14:17])
+
+    return datetime(year, month, day, hour, minute, second, millisecond * 1000, tzinfo=timezone.utc)
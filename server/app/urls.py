@@ -1,9 +1,21 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import views, async_views
 
-urlpatterns = [
-    path("get/previews/", views.get_previews, name="previews"),
-    path("get/article/", views.get_article, name="article"),
-    path("create/article/", views.create_article, name="create-article"),
-    path("change/article/", views.change_article, name="change-article"),
-]
+# The read endpoints are served by either module, see app.benchmark for both
+def get_urlpatterns(read_views):
+    return [
+        path("get/previews/", read_views.get_previews, name="previews"),
+        path("get/article/", read_views.get_article, name="article"),
+        path("get/articles/", read_views.get_articles, name="articles"),
+        path("get/changes/", read_views.get_changes, name="changes"),
+        path("get/search/", read_views.get_search, name="search"),
+        path("get/revisions/", views.get_revisions, name="revisions"),
+        path("get/revision/", views.get_revision, name="revision"),
+        path("create/article/", views.create_article, name="create-article"),
+        path("change/article/", views.change_article, name="change-article"),
+        path("write/articles/", views.write_articles, name="write-articles"),
+        path("metrics/", views.get_metrics, name="metrics"),
+    ]
+
+urlpatterns = get_urlpatterns(async_views if settings.CROSSCUTT_ASYNC_VIEWS else views)
@@ -1,57 +1,455 @@
+from django.conf import settings
 from django.shortcuts import render
-from django.http import JsonResponse
-from django.db import transaction
-from django.db.models import Q
+import hashlib
+import hmac
+import json
+import operator
+from collections import namedtuple
+from functools import reduce
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.core.exceptions import ValidationError
+from django.db import transaction, IntegrityError
+from django.db.models import Q, Count, Max
 from django.utils import timezone
-from .models import Article as DbArticle
-from .permissions import crosscutt_permissions
+from django.utils.cache import get_conditional_response, patch_vary_headers, quote_etag
+from django.utils.dateparse import parse_datetime
+from django.utils.http import http_date
+from .models import (
+    NAMES_QUERY_CHUNK_SIZE, Article as DbArticle, ArticleName, ArticleRevision, VersionConflictException, bulk_change_articles,
+    bulk_create_articles)
+from .permissions import crosscutt_permissions, readable_namespaces
 from django.views.decorators.csrf import csrf_exempt
-from .domain.locator import LocatorSerializationService
-from .domain.article import Article, ArticleSerializationService
+from .domain.locator import Locator, LocatorSerializationService, DeserializationException
+from .domain.article import ArticleSerializationService
+from .domain.preview import ArticlePreview, ArticlePreviewSerializationService
+from .cache import article_cache
+from .compression import compressed_response
+from .metrics import measure, metrics
+from .search import search_articles, SearchUnavailableException
 
-class ArticleIntegrityException(Exception):
-    pass
+MAX_PREVIEWS_PAGE_SIZE = 1000
+
+MAX_ARTICLES_BATCH_SIZE = 100
+
+MAX_SEARCH_RESULTS = 100
+
+MAX_REVISIONS_PAGE_SIZE = 1000
+
+MAX_WRITE_BATCH_SIZE = 1000
+
+# Format 1 encodes the article as a JSON string within the response, format 2
+# as a nested object. Clients choose with the format query parameter or the
+# X-Crosscutt-Format header; without either they get format 1.
+WIRE_FORMAT_HEADER = "X-Crosscutt-Format"
 
 def get_previews(request):
-    return JsonResponse(getPreviewsJson(request.user))
+    return previews_response(request, get_readable_namespaces(request.user))
+
+# The previews change whenever an article is written, which sets its
+# changed_at, including by update-previews
+def previews_response(request, namespaces, prefetch=False):
+    version = DbArticle.objects.filter(namespace__in=namespaces).aggregate(Max("changed_at"), Count("pk"))
+    last_modified_at = version["changed_at__max"]
+
+    # Deleting or moving away an article changes the count, but not necessarily
+    # the maximum, so both go into the ETag. Of the query parameters, only
+    # those that change the body do, so that other parameters do not fill the
+    # compressed response cache with copies of the same previews.
+    parameters = ["stream" in request.GET, request.GET.get("limit"), request.GET.get("after")]
+    etag = "previews-%s-%s-%s" % (
+        version["pk__count"],
+        last_modified_at.timestamp() if last_modified_at is not None else "",
+        hashlib.md5((",".join(sorted(namespaces)) + "?" + json.dumps(parameters)).encode()).hexdigest())
+
+    return conditional_response(request, etag, last_modified_at, lambda: get_previews_response(request, namespaces, etag, prefetch))
+
+# With prefetch, streamed previews are loaded before the response is returned.
+# Django iterates streaming responses within the event loop when running under
+# ASGI, where the database must not be accessed. The complete list is
+# compressed once per version, which the ETag identifies.
+def get_previews_response(request, namespaces, etag, prefetch=False):
+    if "stream" in request.GET:
+        previews = iter_previews(previews_queryset(namespaces))
+        if prefetch:
+            previews = list(previews)
+        return StreamingHttpResponse(streamPreviewsJson(previews), content_type="application/json")
+
+    if "limit" in request.GET or "after" in request.GET:
+        try:
+            limit = min(int(request.GET.get("limit", MAX_PREVIEWS_PAGE_SIZE)), MAX_PREVIEWS_PAGE_SIZE)
+            after = LocatorSerializationService.deserialize(request.GET["after"]) if "after" in request.GET else None
+        except (ValueError, DeserializationException):
+            return error_json_response("invalid cursor or limit")
+
+        if limit < 1:
+            return error_json_response("invalid cursor or limit")
+
+        return JsonResponse(getPreviewsPageJson(namespaces, after, limit))
+
+    return compressed_response(request, ("previews", etag), lambda: json.dumps(getPreviewsJson(namespaces)))
+
+def get_changes(request):
+    return changes_response(request, get_readable_namespaces(request.user))
+
+def changes_response(request, namespaces):
+    try:
+        since, after = parse_changes_cursor(request.GET.get("since", ""))
+        limit = min(int(request.GET.get("limit", MAX_PREVIEWS_PAGE_SIZE)), MAX_PREVIEWS_PAGE_SIZE)
+    except ValueError:
+        return error_json_response("invalid timestamp or limit")
+
+    if since is None or limit < 1:
+        return error_json_response("invalid timestamp or limit")
+
+    return JsonResponse(getChangesJson(namespaces, since, after, limit))
+
+# Many articles can be changed at the same time, so the cursor of the change
+# feed is the time of the last change on a page together with the primary key
+# of its article, separated by a comma. The first request only gives a time.
+def parse_changes_cursor(cursor):
+    timestamp, separator, pk = cursor.partition(",")
+    return parse_datetime(timestamp), int(pk) if separator else None
 
+def format_changes_cursor(changed_at, pk):
+    return "%s,%d" % (changed_at.isoformat(), pk)
+
+def get_search(request):
+    return search_response(request, get_readable_namespaces(request.user))
+
+def search_response(request, namespaces):
+    try:
+        limit = min(int(request.GET.get("limit", MAX_SEARCH_RESULTS)), MAX_SEARCH_RESULTS)
+    except ValueError:
+        return error_json_response("invalid limit")
+
+    # SQLite takes a negative LIMIT for no limit at all
+    if limit < 1:
+        return error_json_response("invalid limit")
+
+    try:
+        hits = search_articles(namespaces, request.GET.get("query", ""), limit)
+    except SearchUnavailableException:
+        return error_json_response("search is not available")
+
+    return JsonResponse({
+        "hits": [
+            { "namespace": namespace, "id": article_id, "title": title, "snippet": snippet }
+            for namespace, article_id, title, snippet in hits
+        ]
+    })
+
+# The article views are split into steps that do not touch the database and
+# steps that do, so that async_views can run the former within the event loop.
 def get_article(request):
-    locator = LocatorSerializationService.deserialize(request.GET["locator"])
+    locator, permissions, response = resolve_article_request(request, get_username(request.user))
+    if response is None:
+        response = cached_article_response(request, locator, permissions)
+    if response is None:
+        response = load_article_response(request, locator, permissions)
+    return response
 
-    name = locator.getName()
-    namespace = locator.getNamespace()
-    permissions = get_permissions(request.user, namespace)
+def resolve_article_request(request, username):
+    locator = LocatorSerializationService.deserialize(request.GET["locator"])
+    permissions = crosscutt_permissions(username, locator.getNamespace())
 
     if permissions != "full" and permissions != "readonly":
-        return JsonResponse({
+        return locator, permissions, JsonResponse({
             "success": False,
             "reason": "forbidden",
         })
 
-    queryset = DbArticle.objects.filter(filter_by_locator(locator))
-    if queryset.exists():
-        article = queryset.get()
-        return JsonResponse(serialize_article_and_permissions(article, permissions))
-    else:
+    return locator, permissions, None
+
+def cached_article_response(request, locator, permissions):
+    cached = article_cache.get((locator.getNamespace(), locator.getName()))
+    if cached is None:
+        return None
+    return versioned_article_response(request, cached, permissions)
+
+# Like cached_article_response, but for the event loop, where nothing slow
+# may run. Returns the cached article along with the response, which is None
+# if the article is not cached or the response would have to be compressed.
+def cached_article_response_without_compressing(request, locator, permissions):
+    cached = article_cache.get((locator.getNamespace(), locator.getName()))
+    if cached is None:
+        return None, None
+    return cached, versioned_article_response(request, cached, permissions, only_cached=True)
+
+def load_article_response(request, locator, permissions):
+    # Answer conditional requests for uncached articles without loading the text
+    if is_conditional(request):
+        version = DbArticle.objects.filter(filter_by_locator(locator)).values_list("pk", "version", "last_modified_at").first()
+        if version is not None:
+            pk, version, last_modified_at = version
+            response = conditional_response(request, article_etag(request, pk, version, permissions), last_modified_at)
+            if response is not None:
+                patch_vary_headers(response, [WIRE_FORMAT_HEADER])
+                return response
+
+    generation = article_cache.get_generation()
+    article = DbArticle.objects.filter(filter_by_locator(locator)).first()
+    if article is None:
         return JsonResponse({
             "success": False,
             "permissions": permissions,
             "reason": "not found",
         })
 
+    return versioned_article_response(request, serialize_article_data(article, generation), permissions)
+
+def versioned_article_response(request, cached, permissions, only_cached=False):
+    response = conditional_response(
+        request,
+        article_etag(request, cached.pk, cached.version, permissions),
+        cached.last_modified_at,
+        lambda: article_response(request, cached, permissions, only_cached))
+    if response is not None:
+        patch_vary_headers(response, [WIRE_FORMAT_HEADER])
+    return response
+
+# Resolves all locators with a single query. The result for each locator has
+# the same shape as the response of get_article for it.
+def get_articles(request):
+    locators, permissions, response = resolve_articles_request(request, get_username(request.user))
+    if response is not None:
+        return response
+
+    articles, missing = cached_articles(locators, permissions)
+    articles.update(load_articles(missing))
+    return articles_response(request, locators, permissions, articles)
+
+def resolve_articles_request(request, username):
+    serialized_locators = request.GET.getlist("locator")
+    if len(serialized_locators) > MAX_ARTICLES_BATCH_SIZE:
+        return None, None, error_json_response("too many locators")
+
+    # Pairs of the serialized and the deserialized locator, in the order of the
+    # request and with repetitions, since there is one result per locator
+    locators = []
+    for serialized_locator in serialized_locators:
+        try:
+            locators.append((serialized_locator, LocatorSerializationService.deserialize(serialized_locator)))
+        except DeserializationException:
+            locators.append((serialized_locator, None))
+
+    permissions = {
+        namespace: crosscutt_permissions(username, namespace)
+        for namespace in {locator.getNamespace() for _, locator in locators if locator is not None}
+    }
+
+    return locators, permissions, None
+
+# The readable articles found in the cache, by (namespace, name), and the keys
+# of the readable articles that are not in the cache
+def cached_articles(locators, permissions):
+    articles = {}
+    missing = []
+    for _, locator in locators:
+        if locator is None or permissions[locator.getNamespace()] not in ["full", "readonly"]:
+            continue
+        key = (locator.getNamespace(), locator.getName())
+        if key in articles or key in missing:
+            continue
+        cached = article_cache.get(key)
+        if cached is not None:
+            articles[key] = cached
+        else:
+            missing.append(key)
+
+    return articles, missing
+
+def load_articles(keys):
+    if not keys:
+        return {}
+
+    generation = article_cache.get_generation()
+    names = ArticleName.objects \
+        .filter(reduce(operator.or_, [Q(namespace=namespace, name=name) for namespace, name in keys])) \
+        .select_related("article")
+    return { (name.namespace, name.name): serialize_article_data(name.article, generation) for name in names }
+
+def articles_response(request, locators, permissions, articles):
+    results = []
+    for serialized_locator, locator in locators:
+        if locator is None:
+            result = { "success": False, "reason": "invalid locator" }
+        elif permissions[locator.getNamespace()] not in ["full", "readonly"]:
+            result = { "success": False, "reason": "forbidden" }
+        elif (locator.getNamespace(), locator.getName()) not in articles:
+            result = { "success": False, "permissions": permissions[locator.getNamespace()], "reason": "not found" }
+        else:
+            cached = articles[(locator.getNamespace(), locator.getName())]
+            results.append('{"locator": ' + json.dumps(serialized_locator) + ', "success": true, "version": ' + str(cached.version) +
+                ', "article": ' + serialized_article_json(request, cached.serialized_data, permissions[locator.getNamespace()]) + "}")
+            continue
+        results.append(json.dumps(dict(result, locator=serialized_locator)))
+
+    response = HttpResponse('{"articles": [' + ", ".join(results) + "]}", content_type="application/json")
+    patch_vary_headers(response, [WIRE_FORMAT_HEADER])
+    return response
+
+def article_etag(request, pk, version, permissions):
+    return "article-%s-%s-%s-%s" % (pk, version, permissions, get_wire_format(request))
+
+# Anything but "2" is format 1, so that ETags and cache keys only ever hold
+# one of the two
+def get_wire_format(request):
+    wire_format = request.GET.get("format") or request.headers.get(WIRE_FORMAT_HEADER)
+    return "2" if wire_format == "2" else "1"
+
+def article_response(request, cached, permissions, only_cached=False):
+    wire_format = get_wire_format(request)
+    return compressed_response(
+        request,
+        ("article", cached.pk, cached.version, wire_format, permissions),
+        lambda: article_json(wire_format, cached, permissions),
+        only_cached=only_cached)
+
+# The body of the response of get_article, also written by export-static
+def article_json(wire_format, cached, permissions):
+    if wire_format == "2":
+        return '{"success": true, "version": ' + str(cached.version) + ', "article": ' + \
+            ArticleSerializationService.serializeNestedWithSerializedData(cached.serialized_data, permissions) + "}"
+    else:
+        return json.dumps(serialize_data_and_permissions(cached, permissions))
+
+# The data is already encoded, so in format 2 it is spliced into the response
+# instead of going through the encoder again
+def serialized_article_json(request, serialized_data, permissions):
+    if get_wire_format(request) == "2":
+        return ArticleSerializationService.serializeNestedWithSerializedData(serialized_data, permissions)
+    else:
+        return json.dumps(ArticleSerializationService.serializeWithSerializedData(serialized_data, permissions))
+
+def is_conditional(request):
+    return "HTTP_IF_NONE_MATCH" in request.META or "HTTP_IF_MODIFIED_SINCE" in request.META
+
+# Returns a 304 response if the validators match the request. Otherwise the
+# response is built and the validators are attached to it. Without a
+# build_response function, None is returned in that case.
+def conditional_response(request, etag, last_modified_at, build_response=None):
+    etag = quote_etag(etag)
+    last_modified = int(last_modified_at.timestamp()) if last_modified_at is not None else None
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        if build_response is None:
+            return None
+        response = build_response()
+        if response is None:
+            return None
+
+    # Compressed and uncompressed bodies are not byte for byte the same
+    response["ETag"] = "W/" + etag if response.has_header("Content-Encoding") else etag
+    if last_modified is not None:
+        response["Last-Modified"] = http_date(last_modified)
+    return response
+
 def filter_by_locator(locator):
-    return Q(namespace=locator.getNamespace()) & (Q(article_id=locator.getName()) | Q(title=locator.getName()))
+    return Q(names__namespace=locator.getNamespace(), names__name=locator.getName())
 
-def serialize_article_and_permissions(db_article, permissions):
+def serialized_article_response(request, db_article, permissions):
+    return article_response(request, serialize_article_data(db_article), permissions)
+
+def serialize_data_and_permissions(cached, permissions):
     return {
         "success": True,
-        "article": ArticleSerializationService.serialize(Article({
+        "version": cached.version,
+        "article": ArticleSerializationService.serializeWithSerializedData(cached.serialized_data, permissions)
+    }
+
+CachedArticle = namedtuple("CachedArticle", ["pk", "version", "last_modified_at", "serialized_data"])
+
+# The serialized data does not depend on the permissions of the user, so it is
+# cached by every name of the article, along with the version of the article.
+# Only articles read after the given generation of article_cache are cached,
+# see LruCache.set. Writers do not cache the articles they have written, since
+# a concurrent write may have been committed after theirs.
+def serialize_article_data(db_article, generation=None):
+    with measure("serialize_article"):
+        serialized_data = ArticleSerializationService.serializeData({
             "namespace": db_article.namespace,
             "id": db_article.article_id,
             "title": db_article.title,
             "text": db_article.text,
-        }, permissions))
-    }
+        })
+
+    cached = CachedArticle(db_article.pk, db_article.version, db_article.last_modified_at, serialized_data)
+    if generation is not None:
+        for key in db_article.get_cache_keys():
+            article_cache.set(key, cached, size=len(serialized_data), generation=generation)
+
+    return cached
+
+# The revisions of an article, newest first, without their texts. Articles
+# may have been moved from namespaces the user cannot read, and revisions
+# from those are left out.
+def get_revisions(request):
+    locator, permissions, response = resolve_article_request(request, get_username(request.user))
+    if response is not None:
+        return response
+
+    try:
+        limit = min(int(request.GET.get("limit", MAX_REVISIONS_PAGE_SIZE)), MAX_REVISIONS_PAGE_SIZE)
+        before = int(request.GET["before"]) if "before" in request.GET else None
+    except ValueError:
+        return error_json_response("invalid version or limit")
+
+    if limit < 1:
+        return error_json_response("invalid version or limit")
+
+    revisions = revisions_by_locator(locator) \
+        .filter(namespace__in=get_readable_namespaces(request.user)) \
+        .order_by("-version")
+    if before is not None:
+        revisions = revisions.filter(version__lt=before)
+    rows = list(revisions.values_list("version", "namespace", "identifier", "title", "created_at")[:limit + 1])
+
+    return JsonResponse({
+        "success": True,
+        "permissions": permissions,
+        "revisions": [
+            { "version": version, "namespace": namespace, "id": identifier, "title": title, "created_at": created_at.isoformat() }
+            for version, namespace, identifier, title, created_at in rows[:limit]
+        ],
+        "complete": len(rows) <= limit,
+    })
+
+# An old version of an article, in the same shape as the response of get_article
+def get_revision(request):
+    locator, permissions, response = resolve_article_request(request, get_username(request.user))
+    if response is not None:
+        return response
+
+    try:
+        version = int(request.GET["version"])
+    except (KeyError, ValueError):
+        return error_json_response("invalid version")
+
+    revision = revisions_by_locator(locator).defer("data").filter(version=version).first()
+    if revision is None:
+        return JsonResponse({
+            "success": False,
+            "permissions": permissions,
+            "reason": "not found",
+        })
+    if revision.namespace not in get_readable_namespaces(request.user):
+        return JsonResponse({
+            "success": False,
+            "permissions": permissions,
+            "reason": "forbidden",
+        })
+
+    serialized_data = ArticleSerializationService.serializeData({
+        "namespace": revision.namespace,
+        "id": revision.identifier,
+        "title": revision.title,
+        "text": revision.get_text(),
+    })
+    return article_response(request, CachedArticle(revision.article_id, version, revision.created_at, serialized_data), permissions)
+
+def revisions_by_locator(locator):
+    return ArticleRevision.objects.filter(article__names__namespace=locator.getNamespace(), article__names__name=locator.getName())
 
 @csrf_exempt
 def create_article(request):
@@ -71,17 +469,15 @@ def create_article(request):
     try:
         with transaction.atomic():
             article = DbArticle(article_id=id, title=title, text=text, namespace=namespace)
-            article.full_clean()
+            article.full_clean(validate_unique=False)
             article.save()
-            validateUnique(namespace, id)
-            validateUnique(namespace, title)
-    except ArticleIntegrityException:
+    except IntegrityError:
         return JsonResponse({
             "success": False,
             "reason": "ID or title are already taken.",
         })
 
-    return JsonResponse(serialize_article_and_permissions(article, permissions))
+    return serialized_article_response(request, article, permissions)
 
 @csrf_exempt
 def change_article(request):
@@ -95,45 +491,301 @@ def change_article(request):
             "reason": "forbidden",
         })
 
+    try:
+        version = int(request.POST["version"]) if "version" in request.POST else None
+    except ValueError:
+        return error_json_response("invalid version")
 
     article = None
     try:
         with transaction.atomic():
+            # The loaded text is the base of the revision that saving records
             article = DbArticle.objects.get(filter_by_locator(locator))
+            # Clients that send the version they have read only overwrite that
+            # version, everybody else overwrites whatever is current
+            if version is not None:
+                article.version = version
             article.namespace = new_data["namespace"]
             article.article_id = new_data["id"]
             article.title = new_data["title"]
             article.text = new_data["text"]
-            article.full_clean()
+            article.full_clean(exclude=["compressed_text"], validate_unique=False)
             article.save()
-            validateUnique(new_data["namespace"], new_data["id"])
-            validateUnique(new_data["namespace"], new_data["title"])
-    except ArticleIntegrityException:
+    except IntegrityError:
         return JsonResponse({
             "success": False,
             "message": "ID or title are already taken.",
         })
+    except VersionConflictException:
+        return JsonResponse({
+            "success": False,
+            "reason": "conflict",
+            "message": "The article has been changed in the meantime.",
+        })
+
+    return serialized_article_response(request, article, permissions)
+
+# Creates and changes many articles in one transaction. The operations are
+# { "create": data } and { "change": locator, "new_data": data, "version": n },
+# where the version is optional, like for change_article. Either all
+# operations are applied or none, and the result of every operation tells
+# whether it failed and why.
+@csrf_exempt
+def write_articles(request):
+    try:
+        operations = json.loads(request.POST["operations"])
+    except (KeyError, ValueError):
+        return error_json_response("invalid operations")
+
+    if not isinstance(operations, list) or len(operations) > MAX_WRITE_BATCH_SIZE:
+        return error_json_response("invalid operations or too many of them")
+
+    username = get_username(request.user)
+    writes = [None] * len(operations)
+    results = [None] * len(operations)
+    for i, operation in enumerate(operations):
+        try:
+            writes[i] = parse_write_operation(operation, username)
+        except WriteOperationException as e:
+            results[i] = e.reason
+
+    try:
+        with transaction.atomic():
+            load_changed_articles(writes, results)
+            check_write_names(writes, results)
+
+            if not any(results):
+                # Changes go first, so that created articles can take the names they give up
+                bulk_change_articles(
+                    [write.article for write in writes if write.locator is not None],
+                    { write.article.pk: write.old_text for write in writes if write.locator is not None })
+                bulk_create_articles([write.article for write in writes if write.locator is None])
+    except IntegrityError:
+        results = ["ID or title are already taken."] * len(operations)
+
+    success = not any(results)
+    return JsonResponse({
+        "success": success,
+        "results": [
+            write_result(write, reason, success)
+            for write, reason in zip(writes, results)
+        ],
+    })
 
-    return JsonResponse(serialize_article_and_permissions(article, permissions))
+class ArticleWrite:
+    __slots__ = ("locator", "data", "version", "article", "old_text")
+
+    def __init__(self, locator, data, version):
+        self.locator = locator
+        self.data = data
+        self.version = version
+        self.article = None
+        self.old_text = None
+
+class WriteOperationException(Exception):
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+# Checks everything about an operation that does not need the database
+def parse_write_operation(operation, username):
+    try:
+        if "create" in operation:
+            write = ArticleWrite(None, ArticleSerializationService.cleanData(operation["create"]), None)
+        else:
+            version = operation.get("version")
+            if version is not None and (not isinstance(version, int) or isinstance(version, bool)):
+                raise WriteOperationException("invalid version")
+            if not isinstance(operation["change"], str):
+                raise WriteOperationException("invalid operation")
+            write = ArticleWrite(
+                LocatorSerializationService.deserialize(operation["change"]),
+                ArticleSerializationService.cleanData(operation["new_data"]),
+                version)
+    except (KeyError, TypeError, AttributeError, DeserializationException):
+        raise WriteOperationException("invalid operation")
+
+    # The data is whatever JSON the client sent, and everything below expects
+    # strings
+    if not all(isinstance(write.data[field], str) for field in ["namespace", "title", "text"]) or \
+            not isinstance(write.data["id"], (str, type(None))):
+        raise WriteOperationException("invalid data")
+
+    namespaces = {write.data["namespace"]}
+    if write.locator is not None:
+        namespaces.add(write.locator.getNamespace())
+    if any(crosscutt_permissions(username, namespace) != "full" for namespace in namespaces):
+        raise WriteOperationException("forbidden")
+
+    if write.locator is None:
+        write.article = DbArticle(namespace=write.data["namespace"], article_id=write.data["id"], title=write.data["title"], text=write.data["text"])
+        clean_written_article(write.article)
+    return write
+
+def clean_written_article(article):
+    try:
+        article.full_clean(exclude=["compressed_text"], validate_unique=False)
+    except ValidationError as e:
+        raise WriteOperationException("invalid data: " + "; ".join(e.messages))
+
+# Loads and locks the articles to change with two queries, and applies the
+# changes to them
+def load_changed_articles(writes, results):
+    changes = [(i, write) for i, write in enumerate(writes) if write is not None and write.locator is not None]
+    owners = find_name_owners({(write.locator.getNamespace(), write.locator.getName()) for _, write in changes})
+    articles = DbArticle.objects.select_for_update().in_bulk(set(owners.values()))
+
+    changed_pks = set()
+    for i, write in changes:
+        article = articles.get(owners.get((write.locator.getNamespace(), write.locator.getName())))
+        if article is None:
+            results[i] = "not found"
+        elif article.pk in changed_pks:
+            results[i] = "changed twice"
+        elif write.version is not None and write.version != article.version:
+            results[i] = "conflict"
+        else:
+            changed_pks.add(article.pk)
+            write.old_text = article.text
+            article.namespace = write.data["namespace"]
+            article.article_id = write.data["id"]
+            article.title = write.data["title"]
+            article.text = write.data["text"]
+            write.article = article
+            try:
+                clean_written_article(article)
+            except WriteOperationException as e:
+                results[i] = e.reason
+
+# Finds the names that the articles would take from other articles, for all
+# articles at once. A name is free if nobody has it, if it belongs to the
+# article itself or if it is given up by an article changed in the same batch.
+def check_write_names(writes, results):
+    claims = {}
+    for i, write in enumerate(writes):
+        if results[i] is None:
+            for key in write.article.get_cache_keys():
+                claims.setdefault(key, []).append(i)
+
+    changed_pks = {write.article.pk for i, write in enumerate(writes) if results[i] is None and write.locator is not None}
+    owners = find_name_owners(claims.keys())
+    for key, claimants in claims.items():
+        owner = owners.get(key)
+        taken = len(claimants) > 1 or (owner is not None and owner not in changed_pks)
+        if taken:
+            for i in claimants:
+                results[i] = "ID or title are already taken."
+
+# The primary keys of the articles with the given (namespace, name) pairs
+def find_name_owners(keys):
+    keys = list(keys)
+    owners = {}
+    for start in range(0, len(keys), NAMES_QUERY_CHUNK_SIZE):
+        chunk = keys[start:start + NAMES_QUERY_CHUNK_SIZE]
+        rows = ArticleName.objects \
+            .filter(namespace__in={namespace for namespace, _ in chunk}, name__in={name for _, name in chunk}) \
+            .values_list("namespace", "name", "article_id")
+        owners.update({ (namespace, name): pk for namespace, name, pk in rows })
+    return owners
+
+def write_result(write, reason, success):
+    if reason is not None:
+        return { "success": False, "reason": reason }
+    if not success:
+        return { "success": False, "reason": "not applied" }
+    return {
+        "success": True,
+        "locator": LocatorSerializationService.serialize(Locator(write.article.namespace, write.article.title)),
+        "version": write.article.version,
+    }
+
+# Metrics in the text format of Prometheus, only for scrapers that know the
+# CROSSCUTT_METRICS_TOKEN
+def get_metrics(request):
+    token = settings.CROSSCUTT_METRICS_TOKEN
+    authorization = request.META.get("HTTP_AUTHORIZATION", "")
+    if token is None or not hmac.compare_digest(authorization.encode(), ("Bearer " + token).encode()):
+        return HttpResponse(status=404)
+    return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
 
 def error_json_response(message):
     return JsonResponse({ "error": message })
 
-def getPreviewsJson(user):
+def getPreviewsJson(namespaces):
     return {
-        "previews": [
-            { "namespace": article.namespace, "id": article.article_id, "title": article.title, "preview": article.text[:200] }
-            for article in DbArticle.objects.all()
-            if get_permissions(user, article.namespace) in ["full", "readonly"]
-        ]
+        "previews": [serialize_preview(preview) for preview in iter_previews(previews_queryset(namespaces))]
+    }
+
+# Keyset pagination over the (namespace, title) pairs, which are unique. The
+# cursor is the locator of the last preview on the page.
+def getPreviewsPageJson(namespaces, after, limit):
+    articles = previews_queryset(namespaces).order_by("namespace", "title")
+    if after is not None:
+        articles = articles.filter(
+            Q(namespace__gt=after.getNamespace()) |
+            Q(namespace=after.getNamespace(), title__gt=after.getName()))
+
+    page = list(iter_previews(articles[:limit + 1]))
+    has_next = len(page) > limit
+    page = page[:limit]
+
+    return {
+        "previews": [serialize_preview(preview) for preview in page],
+        "next": LocatorSerializationService.serialize(Locator(page[-1].namespace, page[-1].title)) if has_next else None,
+    }
+
+# Articles written after the given cursor, oldest first, see
+# parse_changes_cursor. Timestamps are formatted by hand because the JSON
+# encoder would cut off the microseconds and the next request would see the
+# last change again.
+def getChangesJson(namespaces, since, after, limit):
+    rows = previews_queryset(namespaces) \
+        .order_by("changed_at", "pk") \
+        .values_list(*PREVIEW_FIELDS, "last_modified_at", "changed_at", "pk")
+    if after is None:
+        rows = rows.filter(changed_at__gt=since)
+    else:
+        rows = rows.filter(Q(changed_at__gt=since) | Q(changed_at=since, pk__gt=after))
+
+    page = list(rows[:limit + 1])
+    has_next = len(page) > limit
+    page = page[:limit]
+
+    return {
+        "changes": [
+            dict(serialize_preview(ArticlePreview._make(row[:-3])), last_modified_at=row[-3].isoformat())
+            for row in page
+        ],
+        "until": format_changes_cursor(page[-1][-2], page[-1][-1]) if page else
+            since.isoformat() if after is None else format_changes_cursor(since, after),
+        "complete": not has_next,
     }
 
-def validateUnique(namespace, name):
-    if name is None:
-        return
+def streamPreviewsJson(previews):
+    yield '{"previews": ['
+    separator = ""
+    for preview in previews:
+        yield separator + json.dumps(serialize_preview(preview))
+        separator = ", "
+    yield "]}"
+
+PREVIEW_FIELDS = ("namespace", "article_id", "title", "preview")
 
-    if DbArticle.objects.filter(Q(namespace=namespace, article_id=name) | Q(namespace=namespace, title=name)).count() > 1:
-        raise ArticleIntegrityException("name " + name + " is not unique")
+# Rows rather than model instances, which are much more expensive to build.
+# The previews are stored with the articles, so the text is never read.
+def previews_queryset(namespaces):
+    return DbArticle.objects \
+        .filter(namespace__in=namespaces) \
+        .values_list(*PREVIEW_FIELDS)
+
+def iter_previews(rows):
+    return map(ArticlePreview._make, rows.iterator())
+
+def serialize_preview(preview):
+    return ArticlePreviewSerializationService.serialize(preview)
+
+def get_readable_namespaces(user):
+    return readable_namespaces(get_username(user))
 
 def parseId(string):
     if len(string) == 0:
@@ -142,5 +794,7 @@ def parseId(string):
         return string
 
 def get_permissions(user, namespace):
-    username = user.username if user.is_authenticated else None
-    return crosscutt_permissions(username, namespace)
+    return crosscutt_permissions(get_username(user), namespace)
+
+def get_username(user):
+    return user.username if user.is_authenticated else None
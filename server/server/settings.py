@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -37,10 +38,11 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
-    'app',
+    'app.apps.AppConfig',
 ]
 
 MIDDLEWARE = [
+    'app.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -74,13 +76,111 @@ WSGI_APPLICATION = 'server.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.1/ref/settings/#databases
 
+# Configured through CROSSCUTT_DB_* environment variables. The default is a
+# SQLite file accessed through app.backends.sqlite3, which applies the
+# CROSSCUTT_SQLITE_* pragmas to every connection. Set CROSSCUTT_DB_CONN_MAX_AGE
+# to keep connections open across requests.
+
+DB_ENGINE = os.environ.get('CROSSCUTT_DB_ENGINE', 'app.backends.sqlite3')
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'ENGINE': DB_ENGINE,
+        'NAME': os.environ.get('CROSSCUTT_DB_NAME', BASE_DIR / 'db.sqlite3'),
+        'USER': os.environ.get('CROSSCUTT_DB_USER', ''),
+        'PASSWORD': os.environ.get('CROSSCUTT_DB_PASSWORD', ''),
+        'HOST': os.environ.get('CROSSCUTT_DB_HOST', ''),
+        'PORT': os.environ.get('CROSSCUTT_DB_PORT', ''),
+        'CONN_MAX_AGE': int(os.environ.get('CROSSCUTT_DB_CONN_MAX_AGE', '0')),
     }
 }
 
+if DB_ENGINE == 'app.backends.sqlite3':
+    DATABASES['default']['OPTIONS'] = {
+        'pragmas': {
+            'journal_mode': os.environ.get('CROSSCUTT_SQLITE_JOURNAL_MODE', 'wal'),
+            'synchronous': os.environ.get('CROSSCUTT_SQLITE_SYNCHRONOUS', 'normal'),
+            'busy_timeout': int(os.environ.get('CROSSCUTT_SQLITE_BUSY_TIMEOUT', '5000')),
+            'mmap_size': int(os.environ.get('CROSSCUTT_SQLITE_MMAP_SIZE', '0')),
+        },
+    }
+
+
+# Permission levels per namespace and user, see app/permissions.py
+
+CROSSCUTT_PERMISSIONS = {
+    "paul": { "paul": "full" },
+    "paul-ro": { "paul": "full", "*": "readonly" },
+    "public": { "paul": "full", "*": "readonly" },
+}
+
+
+# Serve the read endpoints with the views in app/async_views.py, which is
+# worthwhile when running under ASGI, see server/asgi.py
+
+CROSSCUTT_ASYNC_VIEWS = False
+
+
+# In-process cache of serialized articles, see app/cache.py
+
+ARTICLE_CACHE_MAX_ENTRIES = 1000
+
+ARTICLE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# Bounds how long writes of other processes go unnoticed, None caches until
+# the entries are evicted, which is only right for a single process writing
+ARTICLE_CACHE_MAX_AGE_SECONDS = float(os.environ.get('CROSSCUTT_ARTICLE_CACHE_MAX_AGE_SECONDS', '10'))
+
+COMPRESSED_RESPONSE_CACHE_MAX_ENTRIES = 1000
+
+COMPRESSED_RESPONSE_CACHE_MAX_BYTES = 32 * 1024 * 1024
+
+# Smaller responses are sent uncompressed
+COMPRESSED_RESPONSE_MIN_BYTES = 1024
+
+# Every that many versions, the revision history stores the whole text of an
+# article instead of the changes to the previous version
+ARTICLE_REVISION_SNAPSHOT_INTERVAL = 20
+
+# Texts of at least that many characters are stored compressed, see
+# app.models.ArticleTextDescriptor. None stores all texts as they are. Run the
+# compress-texts command after changing this to convert the stored texts.
+ARTICLE_TEXT_COMPRESSION_THRESHOLD = None
+
+# Instrumentation by app.middleware.MetricsMiddleware, whose metrics are served
+# by the metrics view to requests with the header "Authorization: Bearer
+# <CROSSCUTT_METRICS_TOKEN>". Without a token, the metrics are not served at
+# all. The address of the client cannot tell scrapers apart, since nginx
+# proxies every request from localhost. Queries that take at least
+# CROSSCUTT_SLOW_QUERY_SECONDS are logged, None logs none. That share of the
+# requests to the URL names in CROSSCUTT_PROFILE_URL_NAMES is profiled, and
+# the CROSSCUTT_PROFILE_LINES most expensive functions are logged.
+CROSSCUTT_SLOW_QUERY_SECONDS = float(os.environ.get('CROSSCUTT_SLOW_QUERY_SECONDS', '0.1'))
+
+CROSSCUTT_PROFILE_URL_NAMES = [name for name in os.environ.get('CROSSCUTT_PROFILE_URL_NAMES', '').split(',') if name]
+
+CROSSCUTT_PROFILE_SAMPLE_RATE = float(os.environ.get('CROSSCUTT_PROFILE_SAMPLE_RATE', '0'))
+
+CROSSCUTT_PROFILE_LINES = 30
+
+CROSSCUTT_METRICS_TOKEN = os.environ.get('CROSSCUTT_METRICS_TOKEN') or None
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'app': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators